@@ -1,109 +1,198 @@
 from LabelDataModel import TextRecognitionImagePatchDataset
-import pickle
-import os
-
-
-class Bookmark:
-    def __init__(self):
-        self._lmdb_path = None
-        self._lmdb_index = 0
-        self._bookmark_path = '.bookmark'
-
-        if os.path.exists(self._bookmark_path):
-            with open(self._bookmark_path, 'rb') as f:
-                self._lmdb_path = pickle.load(f)
-                self._lmdb_index = pickle.load(f)
-
-    def update_all(self, path, index):
-        self._lmdb_path = path
-        self._lmdb_index = index
-        with open(self._bookmark_path, 'wb') as f:
-            pickle.dump(self._lmdb_path, f)
-            pickle.dump(self._lmdb_index, f)
-
-    def update_index(self, index):
-        self._lmdb_index = index
-        with open(self._bookmark_path, 'wb') as f:
-            pickle.dump(self._lmdb_path, f)
-            pickle.dump(self._lmdb_index, f)
-
-    @property
-    def index(self):
-        return self._lmdb_index
-
-    @property
-    def lmdb_path(self):
-        return self._lmdb_path
+from PatchFilter import PatchFilter
+from SessionStore import SessionStore
+from LeaseTable import default_owner
+import re
+import time
+import numpy as np
 
 
 class Controller:
-    def __init__(self, view=None, data=None):
-        self._bookmark = Bookmark()
-        self._patch_start_index = self._bookmark.index
+    def __init__(self, view=None, data=None, sessions=None):
+        self._sessions = SessionStore() if sessions is None else sessions
+        self._lmdb_path = None
+        self._patch_start_index = 1
         self._patch_image_count = 0
         self._view = view
+        self._lease = None
+        self._owner = default_owner()
 
         if data is None:
             self._data = TextRecognitionImagePatchDataset()
         else:
             self._data = data
 
-    def load_bookmark(self):
-        if self._bookmark.lmdb_path is not None:
-            self.open_lmdb(self._bookmark.lmdb_path)
+    def set_display_size(self, display_size):
+        # pages are read with images decoded to the size the view shows them at
+        self._data.set_display_size(display_size)
+
+    def load_session(self):
+        if self._sessions.last_dataset is not None:
+            self.open_lmdb(self._sessions.last_dataset)
+
+    def stored_page_size(self):
+        if self._sessions.last_dataset is None:
+            return None
+        return self._sessions.get(self._sessions.last_dataset)['page_size']
 
     def get_status_text(self):
-        if self._bookmark.lmdb_path is None:
+        if self._lmdb_path is None:
             return None
-        else:
-            return self._bookmark.lmdb_path + ': {}/{}'.format(self._patch_start_index, self._patch_image_count)
+        text = self._lmdb_path
+        if self._data.filter is not None:
+            text += ' [{}]'.format(self._data.filter.expression)
+        if self._lease is not None:
+            text += ' leased {}:{}'.format(self._lease.start, self._lease.stop)
+        # positions in a filter result count from 0 internally, the status counts from 1 either way
+        text += ': {}/{}'.format(self._patch_start_index - self._data.first_index + 1, self._patch_image_count)
+        viewed, verified, total = self.review_progress()
+        if total > 0:
+            text += ' reviewed {:.1f}% viewed {:.1f}%'.format(100.0 * verified / total, 100.0 * viewed / total)
+        return text
+
+    def review_progress(self):
+        # (viewed, verified, total) records of the open dataset, or of the active filter
+        filter_indices = self._data.filter_indices
+        if filter_indices is not None:
+            return (int(np.count_nonzero(self._viewed().marked(filter_indices))),
+                    int(np.count_nonzero(self._verified().marked(filter_indices))), len(filter_indices))
+        return self._viewed().count(), self._verified().count(), self._data.sample_count
+
+    def _viewed(self):
+        return self._sessions.viewed(self._lmdb_path, self._data.sample_count + 1)
+
+    def _verified(self):
+        return self._sessions.verified(self._lmdb_path, self._data.sample_count + 1)
+
+    def _page_indices(self):
+        count = self._view.image_patch_count if self._view is not None else 1
+        stop = min(self._patch_start_index + count, self._patch_image_count + self._data.first_index)
+        if self._data.filter is None:
+            return np.arange(self._patch_start_index, stop)
+        return np.array([self._data.index_at(position) for position in range(self._patch_start_index, stop)],
+                        dtype=np.int64)
+
+    def _save_session(self):
+        if self._lmdb_path is None:
+            return
+        self._renew_lease()
+        self._sessions.update(self._lmdb_path, position=self._patch_start_index,
+                              filter=self._data.filter.expression if self._data.filter is not None else '',
+                              page_size=self._view.image_patch_count if self._view is not None else None)
 
     def notify_label_change(self, index, label):
-        self._data.set_label(index, label)
+        # the unique view shows one patch per near duplicate cluster, its label goes to every member
+        if self._data.filter is not None and self._data.filter.unique:
+            self._data.set_cluster_label(index, label)
+        else:
+            self._data.set_label(index, label)
+        self._verified().mark([index])
+
+    def claim_range(self, size=1000):
+        # hands the leased range back as done and leases the next one, the view is filtered to it
+        lease_table = self._data.lease_table()
+        if lease_table is None:
+            return None
+        if self._lease is not None:
+            lease_table.release(self._lease, done=True)
+            self._lease = None
+        lease = lease_table.acquire(self._owner, size)
+        if lease is None:
+            print('every range of {} is labeled or leased'.format(self._lmdb_path))
+            return None
+        self._lease = lease
+        self.set_filter('range={}:{}'.format(lease.start, lease.stop))
+        return lease
+
+    def _renew_lease(self):
+        # paging is the heartbeat, a lease is renewed once half of its time ran out
+        lease_table = self._data.lease_table() if self._lease is not None else None
+        if lease_table is None or self._lease.expires - time.time() > lease_table.ttl / 2:
+            return
+        lease = lease_table.renew(self._lease)
+        if lease is None:
+            print('lease {}:{} expired and was taken over'.format(self._lease.start, self._lease.stop))
+        self._lease = lease
+
+    def _release_lease(self):
+        # an unfinished range goes back to the pool for the next labeler
+        if self._lease is not None:
+            lease_table = self._data.lease_table()
+            if lease_table is not None:
+                lease_table.release(self._lease, done=False)
+            self._lease = None
 
     def open_lmdb(self, lmdb_path, start_index=None):
+        self._release_lease()
         if self._data.connect_dataset(lmdb_path) is None:
             return None
-        if start_index is not None:
-            self._patch_start_index = start_index
+        self._lmdb_path = lmdb_path
+        session = self._sessions.get(lmdb_path)
+        if session['filter']:
+            try:
+                self._data.set_filter(PatchFilter.parse(session['filter']))
+            except (ValueError, re.error) as e:
+                print('stored filter {} is not valid: {}'.format(session['filter'], e))
+        self._patch_start_index = start_index if start_index is not None else session['position']
         self._patch_image_count = self._data.patch_count
         if self._view is not None:
-            self._view.update_image_patch(self._data.get_patch_list(self._view.image_patch_count,
-                                                                    self._patch_start_index))
+            self._view.dataset_opened()
+            self._load_page()
         else:
             print('Controller: open image')
 
-        self._bookmark.update_all(lmdb_path, self._patch_start_index)
+        self._save_session()
+        return True
+
+    def set_filter(self, expression):
+        if expression:
+            patch_filter = PatchFilter.parse(expression)
+        else:
+            patch_filter = None
+        if self._data.set_filter(patch_filter) is None:
+            return None
+
+        self._patch_image_count = self._data.patch_count
+        self._patch_start_index = self._data.first_index
+        if self._view is not None:
+            self._load_page()
+        self._save_session()
+        return self._patch_image_count
 
     def go(self, record_num):
         if self._view is None:
             print('Controller: next patch')
             return
 
+        # in a filtered view record_num is a record index, paging works on positions in the filter result
+        record_num = self._data.position_of(record_num)
+        first_index = self._data.first_index
         if record_num == 0:
-            self._patch_start_index = 1
+            self._patch_start_index = first_index
         elif record_num > self._patch_image_count > self._view.image_patch_count:
             self._patch_start_index = self._patch_image_count - self._view.image_patch_count
         elif record_num > self._patch_image_count and self._patch_image_count < self._view.image_patch_count:
-            self._patch_start_index = 1
+            self._patch_start_index = first_index
         else:
             self._patch_start_index = record_num
 
-        self._view.update_image_patch(self._data.get_patch_list(self._view.image_patch_count, self._patch_start_index))
-        self._bookmark.update_index(self._patch_start_index)
+        self._load_page()
+        self._save_session()
 
     def next_patch(self):
         if self._view is None:
             print('Controller: next patch')
             return
 
+        # moving on from a page confirms its labels
+        self._verified().mark(self._page_indices())
         if self._patch_start_index + self._view.image_patch_count > self._patch_image_count:
-            self._patch_start_index = 1
+            self._patch_start_index = self._data.first_index
         else:
             self._patch_start_index = self._patch_start_index + self._view.image_patch_count
 
-        self._view.update_image_patch(self._data.get_patch_list(self._view.image_patch_count, self._patch_start_index))
-        self._bookmark.update_index(self._patch_start_index)
+        self._load_page()
+        self._save_session()
 
     def prev_patch(self):
         if self._view is None:
@@ -111,12 +200,108 @@ class Controller:
             return
 
         if self._patch_start_index - self._view.image_patch_count < 0:
-            self._patch_start_index = self._patch_image_count - self._view.image_patch_count
+            self._patch_start_index = max(self._patch_image_count - self._view.image_patch_count,
+                                          self._data.first_index)
         else:
             self._patch_start_index = self._patch_start_index - self._view.image_patch_count
 
-        self._view.update_image_patch(self._data.get_patch_list(self._view.image_patch_count, self._patch_start_index))
-        self._bookmark.update_index(self._patch_start_index)
+        self._load_page()
+        self._save_session()
+
+    def find(self, query, backward=False):
+        # pages to the next (or previous) record whose label matches the query, wrapping around at the ends
+        hits = self._data.search_labels(query)
+        if hits is not None and self._data.filter_indices is not None:
+            # a filtered view can only show records of the filter
+            hits = hits[np.isin(hits, self._data.filter_indices)]
+        if hits is None or len(hits) == 0:
+            return None
+
+        current = self._data.index_at(self._patch_start_index)
+        if backward:
+            position = int(np.searchsorted(hits, current, side='left')) - 1
+        else:
+            position = int(np.searchsorted(hits, current, side='right'))
+        position %= len(hits)
+        index = int(hits[position])
+        self.go(index)
+        return index, position, len(hits)
+
+    def next_suspicious_patch(self, min_pixels_per_char=5, backward=False):
+        metadata = self._data.metadata
+        if metadata is None:
+            print('Controller: build the metadata index first (tool/build_metadata.py)')
+            return None
+
+        find = metadata.find_prev if backward else metadata.find_next
+        index = find(self._in_filter(metadata.suspicious_mask(min_pixels_per_char)),
+                     self._data.index_at(self._patch_start_index))
+        if index is None:
+            return None
+        self.go(index)
+        return index
+
+    def _in_filter(self, mask):
+        # a filtered view can only show records of the filter
+        filter_indices = self._data.filter_indices
+        if filter_indices is None:
+            return mask
+        in_filter = np.zeros(len(mask), dtype=bool)
+        in_filter[filter_indices[filter_indices < len(mask)]] = True
+        return mask & in_filter
+
+    def relabel(self, label, old_label=None, label_regex=None, cluster_of=None):
+        # corrects a systematic error: every record matching the search gets the new label
+        indices = self._data.find_indices(old_label, label_regex, cluster_of)
+        if indices is None:
+            return None
+        count = self._data.relabel(indices, label)
+        if count and self._view is not None:
+            self._load_page()
+        return count
+
+    def undo(self):
+        count = self._data.undo()
+        if count and self._view is not None:
+            self._load_page()
+        return count
+
+    def redo(self):
+        count = self._data.redo()
+        if count and self._view is not None:
+            self._load_page()
+        return count
+
+    def next_unreviewed_patch(self):
+        filter_indices = self._data.filter_indices
+        if filter_indices is not None:
+            # only the records of the filter, a leased range included, from the current one on and then from the top
+            unmarked = filter_indices[~self._verified().marked(filter_indices)]
+            if len(unmarked) == 0:
+                return None
+            position = int(np.searchsorted(unmarked, self._data.index_at(self._patch_start_index)))
+            index = int(unmarked[position % len(unmarked)])
+            self.go(index)
+            return index
+
+        index = self._verified().first_unmarked(self._data.index_at(self._patch_start_index))
+        if index is None:
+            index = self._verified().first_unmarked(self._data.first_index)
+        if index is None or index > self._data.sample_count:
+            return None
+        self.go(index)
+        return index
+
+    def _load_page(self):
+        count = self._view.image_patch_count
+        start = self._patch_start_index
+        self._viewed().mark(self._page_indices())
+        self._view.load_image_patch(lambda: self._data.get_patch_list(count, start))
 
     def notify_view_selected(self, index):
         pass
+
+    def close(self):
+        self._release_lease()
+        self._data.close()
+        self._sessions.close()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+
+HASH_WIDTH = 16
+HASH_HEIGHT = 4
+HASH_BITS = HASH_WIDTH * HASH_HEIGHT
+GRADIENT_STEP = 2
+NO_CLUSTER = -1
+
+
+def duplicates_path(lmdb_path):
+    return os.path.join(lmdb_path, 'duplicates')
+
+
+def difference_hash(image):
+    # 64 bit dHash, horizontal brightness gradients of a 17x4 thumbnail, which follows the shape of a text line.
+    # flat background only sets a bit on a clear step, otherwise noise would flip it
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (HASH_WIDTH + 1, HASH_HEIGHT), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] - small[:, :-1] > GRADIENT_STEP).reshape(-1)
+    return np.uint64(int(np.packbits(bits).view('>u8')[0]))
+
+
+def hash_image_bytes(image_bytes):
+    # a reduced decode is enough for a 17x4 thumbnail and a lot cheaper than a full one
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if image is None or image.size == 0:
+        return None
+    return difference_hash(image)
+
+
+MAX_GROUP = 1024
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def hamming_distance(a, b):
+    diff = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return _BYTE_POPCOUNT[diff.reshape(diff.shape + (1,)).view(np.uint8)].sum(axis=-1, dtype=np.uint8)
+
+
+def find_root(parent, node):
+    root = node
+    while parent[root] != root:
+        root = parent[root]
+    while parent[node] != root:
+        parent[node], node = root, parent[node]
+    return root
+
+
+def union(parent, a, b):
+    a = find_root(parent, a)
+    b = find_root(parent, b)
+    if a != b:
+        parent[max(a, b)] = min(a, b)
+
+
+def split_bits(free_mask, count):
+    bits = [bit for bit in range(HASH_BITS) if (free_mask >> bit) & 1]
+    return [sum(1 << int(bit) for bit in chunk) for chunk in np.array_split(bits, count) if len(chunk)]
+
+
+def link_similar(hashes, parent, members, free_mask, max_distance):
+    # multi-index hashing: split the bits that may still differ into max_distance + 1 bands. two hashes within
+    # max_distance bits agree exactly on at least one band, so only hashes sharing a band value are compared.
+    # groups that are still too large are split again on their remaining bits
+    if len(members) <= MAX_GROUP or bin(free_mask).count('1') <= max_distance + 1:
+        group = hashes[members]
+        for i, j in zip(*np.nonzero(np.triu(hamming_distance(group[:, None], group[None, :]) <= max_distance, 1))):
+            union(parent, int(members[i]), int(members[j]))
+        return
+
+    for band_mask in split_bits(free_mask, max_distance + 1):
+        bands = hashes[members] & np.uint64(band_mask)
+        order = np.argsort(bands, kind='stable')
+        splits = np.flatnonzero(np.diff(bands[order])) + 1
+        for group in np.split(members[order], splits):
+            if len(group) > 1:
+                link_similar(hashes, parent, group, free_mask & ~band_mask, max_distance)
+
+
+def cluster_hashes(hashes, max_distance=3):
+    unique, inverse = np.unique(hashes, return_inverse=True)
+    parent = np.arange(len(unique))
+    link_similar(unique, parent, np.arange(len(unique)), (1 << HASH_BITS) - 1, max_distance)
+    roots = np.array([find_root(parent, node) for node in range(len(unique))], dtype=np.int64)
+    return roots[inverse]
+
+
+# memory mapped perceptual hash per record and the cluster it belongs to, labelled by its lowest record index
+class DuplicateIndex:
+    def __init__(self, path, hashes, clusters):
+        self._path = path
+        self._hashes = hashes
+        self._clusters = clusters
+
+    @classmethod
+    def create(cls, path, size):
+        os.makedirs(path, exist_ok=True)
+        hashes = np.lib.format.open_memmap(os.path.join(path, 'hashes.npy'), mode='w+', dtype=np.uint64,
+                                           shape=(size,))
+        clusters = np.lib.format.open_memmap(os.path.join(path, 'clusters.npy'), mode='w+', dtype=np.int64,
+                                             shape=(size,))
+        clusters[:] = NO_CLUSTER
+        return cls(path, hashes, clusters)
+
+    @classmethod
+    def open(cls, path):
+        hashes_path = os.path.join(path, 'hashes.npy')
+        clusters_path = os.path.join(path, 'clusters.npy')
+        if not os.path.exists(hashes_path) or not os.path.exists(clusters_path):
+            return None
+        return cls(path, np.load(hashes_path, mmap_mode='r+'), np.load(clusters_path, mmap_mode='r+'))
+
+    def __len__(self):
+        return len(self._hashes)
+
+    @property
+    def hashes(self):
+        return self._hashes
+
+    @property
+    def clusters(self):
+        return self._clusters
+
+    def set_hash(self, index, value):
+        self._hashes[index] = value
+        self._clusters[index] = index
+
+    def build_clusters(self, max_distance=3):
+        indices = np.flatnonzero(self._clusters != NO_CLUSTER)
+        if len(indices) == 0:
+            return 0
+        roots = cluster_hashes(np.asarray(self._hashes[indices]), max_distance)
+        # the representative of a cluster is its lowest record index
+        representative = np.full(len(indices), len(self._clusters), dtype=np.int64)
+        np.minimum.at(representative, roots, indices)
+        self._clusters[indices] = representative[roots]
+        return int(np.count_nonzero(self._clusters[indices] == indices))
+
+    def members(self, index):
+        cluster = self._clusters[index]
+        if cluster == NO_CLUSTER:
+            return np.array([index], dtype=np.int64)
+        return np.flatnonzero(self._clusters == cluster)
+
+    def representative_mask(self):
+        # records without a hash are their own cluster
+        return (self._clusters == np.arange(len(self._clusters))) | (self._clusters == NO_CLUSTER)
+
+    def cluster_sizes(self):
+        clusters = self._clusters[self._clusters != NO_CLUSTER]
+        return np.bincount(clusters, minlength=len(self._clusters))
+
+    def flush(self):
+        self._hashes.flush()
+        self._clusters.flush()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+
+    def lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:
+    import msvcrt
+
+    def lock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+EDIT = 'edit'
+UNDO = 'undo'
+REDO = 'redo'
+REVERT = 'revert'
+REPLAY = 'replay'
+MERGE = 'merge'
+
+# single label edits of one record following each other this closely are undone together, like the
+# keystrokes of one word
+COALESCE_SECONDS = 5.0
+
+
+def edit_log_path(lmdb_path):
+    return os.path.join(lmdb_path, 'edits.log')
+
+
+def new_session():
+    return '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+
+
+def net_edits(entries):
+    # index -> (label before the first entry, label after the last one)
+    edits = {}
+    for entry in entries:
+        for index, old, new in entry['edits']:
+            edits[index] = (edits[index][0] if index in edits else old, new)
+    return edits
+
+
+# append-only log of label changes, one json line per entry:
+#   {"id", "time", "session", "op", "target", "edits": [[index, old label, new label], ...]}
+# undo, redo and reverts are entries too, so replaying the log always ends at the current labels.
+# several labeler processes may append to the same log, a file lock orders their entries. every session
+# has its own undo and redo stack, rebuilt from the ops when the log is opened
+class EditLog:
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._info = {}
+        self._sessions = {}
+        self._undo = {}
+        self._redo = {}
+        self._last_id = 0
+        self._end = 0
+        self._file = open(path, 'ab')
+        with self._locked():
+            # a write torn by a crash, everything before it is intact
+            if self._end < os.path.getsize(self._path):
+                os.truncate(self._path, self._end)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            lock_file(self._file)
+            try:
+                self._catch_up()
+                yield
+            finally:
+                unlock_file(self._file)
+
+    def _catch_up(self):
+        # entries appended by other processes since the last look
+        with open(self._path, 'rb') as f:
+            f.seek(self._end)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                self._add(entry, self._end)
+                self._end += len(line)
+
+    def _add(self, entry, offset):
+        entry_id = entry['id']
+        edits = entry['edits']
+        single = edits[0][0] if len(edits) == 1 else None
+        self._offsets[entry_id] = offset
+        self._info[entry_id] = (entry['session'], entry['op'], entry['time'], single)
+        self._sessions.setdefault(entry['session'], []).append(entry_id)
+        self._last_id = entry_id
+
+        op = entry['op']
+        undo = self._undo.setdefault(entry['session'], [])
+        redo = self._redo.setdefault(entry['session'], [])
+        if op == UNDO:
+            if undo:
+                redo.append(undo.pop())
+        elif op == REDO:
+            if redo:
+                undo.append(redo.pop())
+        elif edits:
+            if single is not None and undo and self._coalesces(undo[-1][-1], entry_id):
+                undo[-1].append(entry_id)
+            else:
+                undo.append([entry_id])
+            redo.clear()
+
+    def _coalesces(self, previous_id, entry_id):
+        session, op, edit_time, single = self._info[previous_id]
+        other_session, other_op, other_time, other_single = self._info[entry_id]
+        return op == EDIT and other_op == EDIT and session == other_session and single == other_single and \
+            other_time - edit_time < COALESCE_SECONDS
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, edits, session, op=EDIT, target=None):
+        with self._locked():
+            entry = {'id': self._last_id + 1, 'time': time.time(), 'session': session, 'op': op, 'target': target,
+                     'edits': [[index, old, new] for index, old, new in edits]}
+            line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._add(entry, self._end)
+            self._end += len(line)
+            return entry['id']
+
+    def read(self, entry_id):
+        with open(self._path, 'rb') as f:
+            f.seek(self._offsets[entry_id])
+            return json.loads(f.readline().decode('utf-8'))
+
+    def entries(self, entry_ids=None):
+        # all entries in log order, or the given ones
+        with self._locked():
+            entry_ids = sorted(self._offsets) if entry_ids is None else list(entry_ids)
+        with open(self._path, 'rb') as f:
+            for entry_id in entry_ids:
+                f.seek(self._offsets[entry_id])
+                yield json.loads(f.readline().decode('utf-8'))
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def has_other_sessions(self, since, session):
+        # whether another session appended entries after the given id
+        with self._locked():
+            return any(self._info[entry_id][0] != session for entry_id in range(since + 1, self._last_id + 1))
+
+    def common_prefix(self, other):
+        # id of the last entry two logs share, the copies of a lmdb diverged after it
+        with self._lock:
+            shared = 0
+            for entry_id in range(1, min(self._last_id, other.last_id) + 1):
+                if self._info.get(entry_id) != other._info.get(entry_id):
+                    break
+                shared = entry_id
+            return shared
+
+    def undo_group(self, session):
+        # the entries the next undo of the session reverts, oldest first
+        with self._lock:
+            undo = self._undo.get(session)
+            return list(undo[-1]) if undo else None
+
+    def redo_group(self, session):
+        with self._lock:
+            redo = self._redo.get(session)
+            return list(redo[-1]) if redo else None
+
+    def sessions(self):
+        # session -> number of entries, oldest session first
+        with self._locked():
+            return {session: len(entry_ids) for session, entry_ids in self._sessions.items()}
+
+    def session_entries(self, session):
+        with self._locked():
+            return list(self._sessions.get(session, []))
+
+    def close(self):
+        self._file.close()
@@ -1,10 +1,16 @@
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import QWidget, QApplication, QLabel, QLineEdit, QHBoxLayout, QPushButton
 from Controller import Controller
+from LabelDataModel import DELETED_LABEL
 
 
 def cv_image_to_qimage(cv_image):
-    return QImage(cv_image.data, cv_image.shape[1], cv_image.shape[0], cv_image.strides[0], QImage.Format_RGB888)
+    # Qt reads the BGR rows of the array in place, the QImage is only valid as long as the array is kept alive
+    height, width = cv_image.shape[:2]
+    if cv_image.ndim == 2:
+        return QImage(cv_image.data, width, height, cv_image.strides[0], QImage.Format_Grayscale8)
+    return QImage(cv_image.data, width, height, cv_image.strides[0], QImage.Format_BGR888)
 
 
 class MyTextEdit(QLineEdit):
@@ -23,6 +29,8 @@ class MyTextEdit(QLineEdit):
 
 
 class ImagePatchView(QWidget):
+    label_committed = pyqtSignal(int, str)
+
     def __init__(self, controller, index=None):
         super().__init__()
         self._image_patch = QLabel()
@@ -35,10 +43,34 @@ class ImagePatchView(QWidget):
         self._controller = controller
         self.init_ui()
 
-    def set(self, index, image, label=None, file_path=None):
-        self._image_patch.setPixmap(QPixmap(cv_image_to_qimage(image)))
+    def set_placeholder(self, text):
+        # no record is bound while the page is loading
+        self._index = None
+        self._text.set_index(None)
+        self._text.setText('')
+        self._text.setEnabled(False)
+        self._button.setEnabled(False)
+        self._image_patch.clear()
+        self._image_patch.setText(text)
+        self._resolution.setText('')
+        self._file_path.setText('')
+
+    def set(self, index, image, label=None, file_path=None, pixmap=None, image_size=None):
+        self._text.setEnabled(True)
+        self._button.setEnabled(True)
+        if pixmap is None and image is not None:
+            pixmap = QPixmap.fromImage(cv_image_to_qimage(image))
+        if pixmap is not None:
+            self._image_patch.setPixmap(pixmap)
+        else:
+            self._image_patch.clear()
+            self._image_patch.setText('no image')
         self._index = index
-        self._resolution.setText(str(image.shape))        
+        # the shown image may be scaled down, the resolution is the one stored
+        if image_size is not None:
+            self._resolution.setText(str((image_size[1], image_size[0], 3)))
+        else:
+            self._resolution.setText(str(image.shape) if image is not None else '')
         if label is not None:
             self._text.setText(label)
             self._text.set_index(index)
@@ -51,6 +83,7 @@ class ImagePatchView(QWidget):
         if self._index is not None:
             self._updated = True
             self._controller.notify_label_change(self._index, self._text.text())
+            self.label_committed.emit(self._index, self._text.text())
 
     def view_selected(self):
         self._controller.notify_view_selected(self._index)
@@ -58,12 +91,14 @@ class ImagePatchView(QWidget):
     def delete_button_clicked(self):
         if self._index is None:
             return
-        self._text.setText('__#DELETED_LABEL#__')
+        self._text.setText(DELETED_LABEL)
         self._updated = True
         self._controller.notify_label_change(self._index, self._text.text())
+        self.label_committed.emit(self._index, self._text.text())
 
     def init_ui(self):
-        self._text.textChanged.connect(self.label_changed)
+        # textEdited only fires for typing, setting a loaded label must not write it back
+        self._text.textEdited.connect(self.label_changed)
         self._button.clicked.connect(self.delete_button_clicked)
         layout = QHBoxLayout()
         layout.addWidget(self._image_patch)
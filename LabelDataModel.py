@@ -2,23 +2,69 @@
 import numpy as np
 import cv2
 import os
-import lmdb
+import re
 import sys
 import six
-import math
+from concurrent.futures import ThreadPoolExecutor
+from PageCache import PageCache
+from RecordLayout import IMAGE, LABEL, detect_layout
+from RecordScan import scan_records, iter_field
+from LabelJournal import LabelJournal
+from LmdbConfig import WRITER, VIEWER, open_environment, is_read_only, begin, write_with_retry
+from MetadataIndex import MetadataIndex, metadata_path, FLAG_TO_BE_DELETED, FLAG_DELETED
+from DuplicateIndex import DuplicateIndex, duplicates_path
+from LabelIndex import LabelIndex, label_index_path
+from LeaseTable import LeaseTable, LEASE_DB
+from EditLog import EditLog, edit_log_path, new_session, net_edits, EDIT, UNDO, REDO, REVERT, MERGE
 
+TO_BE_DELETED_LABEL = '__#TO_BE_DELETED#__'
+DELETED_LABEL = '__#DELETED_LABEL#__'
 
-class ImagePatchData:
+# how a label that differs between two copies of a lmdb is merged
+KEEP_MINE = 'mine'
+TAKE_THEIRS = 'theirs'
+CONFLICT = 'conflict'
+
+
+# reductions cv2.imdecode can apply while decoding, a JPEG is then decoded at the smaller size directly
+REDUCED_READ_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
 
-    def __init__(self, index, image, label, file_path):
+
+class ImagePatchData:
+    # the image stays encoded, a page holds the bytes and, when the dataset has a display size, the image decoded
+    # to that size. a full size decode through image is never kept, so the page cache knows what a page weighs
+    def __init__(self, index, image_bytes, label, file_path, image_size=None, display=None):
         self._index = index
-        self._image = image
+        self._image_bytes = image_bytes
+        self._image_size = image_size
+        self._display = display
         self._label = label
         self._file_path = file_path 
 
     @property
     def image(self):
-        return self._image
+        if self._image_bytes is None:
+            return None
+        return cv2.imdecode(np.frombuffer(self._image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    @property
+    def image_size(self):
+        # (width, height) of the stored image, read from the header where possible
+        if self._image_size is None:
+            image = self.image
+            if image is not None:
+                self._image_size = image.shape[1], image.shape[0]
+        return self._image_size
+
+    @property
+    def display(self):
+        # the image decoded to the display size when the page was read, None without one
+        return self._display
+
+    @property
+    def nbytes(self):
+        size = len(self._image_bytes) if self._image_bytes is not None else 0
+        return size + (self._display.nbytes if self._display is not None else 0)
 
     @property
     def label(self):
@@ -32,6 +78,48 @@ class ImagePatchData:
     def file_path(self):
         return self._file_path
 
+    def display_image(self, max_width, max_height):
+        if self._display is not None and fit_size(*self.image_size, max_width, max_height) == \
+                (self._display.shape[1], self._display.shape[0]):
+            return self._display
+        image, self._image_size = decode_display_image(self._image_bytes, self._image_size, max_width, max_height)
+        return image
+
+    def with_label(self, label):
+        return ImagePatchData(self._index, self._image_bytes, label, self._file_path, self._image_size, self._display)
+
+
+def decode_display_image(image_bytes, image_size, max_width, max_height):
+    # (image fit into max_width x max_height, stored size). an image at least twice as large as the display is
+    # decoded reduced, image_size from the header picks the reduction, without it the image is decoded full
+    if image_bytes is None:
+        return None, image_size
+    flag = cv2.IMREAD_COLOR if image_size is None else reduced_read_flag(*image_size, max_width, max_height)
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if image is None:
+        return None, image_size
+    height, width = image.shape[:2]
+    if image_size is None:
+        image_size = width, height
+    size = fit_size(width, height, max_width, max_height)
+    if size != (width, height):
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image, image_size
+
+
+def fit_size(width, height, max_width, max_height):
+    scale = min(max_width / width, max_height / height, 1.0)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def reduced_read_flag(width, height, max_width, max_height):
+    # the largest reduction that still leaves the image at least as large as it is displayed
+    scale = min(max_width / max(width, 1), max_height / max(height, 1))
+    for factor, flag in REDUCED_READ_FLAGS:
+        if factor * scale <= 1.0:
+            return flag
+    return cv2.IMREAD_COLOR
+
 
 def lmdb_put_image(txn, key, image):
     is_success, buffer = cv2.imencode('.jpg', image)
@@ -82,6 +170,67 @@ def lmdb_get_image(txn, key):
     return image
 
 
+def get_image_size(image_bytes):
+    # (width, height) read from a PNG or JPEG header, None for anything else
+    data = bytes(image_bytes[:24])
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if data[:2] != b'\xff\xd8':
+        return None
+
+    data = memoryview(image_bytes)
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            offset += 2
+            continue
+        length = (data[offset + 2] << 8) | data[offset + 3]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if offset + 9 > len(data):
+                return None
+            height = (data[offset + 5] << 8) | data[offset + 6]
+            width = (data[offset + 7] << 8) | data[offset + 8]
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def diff_label_streams(mine, theirs):
+    # merge join of two index ordered (index, label) streams, yields (index, mine, theirs) for every index whose
+    # labels differ, with None for the side missing the record. the two lmdbs may use different layouts
+    mine_item = next(mine, None)
+    theirs_item = next(theirs, None)
+    while mine_item is not None or theirs_item is not None:
+        if theirs_item is None or (mine_item is not None and mine_item[0] < theirs_item[0]):
+            yield mine_item[0], mine_item[1], None
+            mine_item = next(mine, None)
+        elif mine_item is None or theirs_item[0] < mine_item[0]:
+            yield theirs_item[0], None, theirs_item[1]
+            theirs_item = next(theirs, None)
+        else:
+            if mine_item[1] != theirs_item[1]:
+                yield mine_item[0], mine_item[1], theirs_item[1]
+            mine_item = next(mine, None)
+            theirs_item = next(theirs, None)
+
+
+def merge_resolution(mine, theirs, base):
+    # a label only one side changed from the common base wins, changes on both sides conflict
+    if mine is None or theirs is None or base is None:
+        return CONFLICT
+    if mine == base:
+        return TAKE_THEIRS
+    if theirs == base:
+        return KEEP_MINE
+    return CONFLICT
+
+
 def lmdb_get_label_key(index):
     return 'label-%09d' % index
 
@@ -93,6 +242,14 @@ def lmdb_get_image_key(index):
 def lmdb_get_path_key(index):
     return 'path-%09d' % index
 
+def label_flags(label):
+    if label == TO_BE_DELETED_LABEL:
+        return FLAG_TO_BE_DELETED
+    if label == DELETED_LABEL:
+        return FLAG_DELETED
+    return 0
+
+
 def get_record_key(index):
     image_key = lmdb_get_image_key(index)
     label_key = lmdb_get_label_key(index)
@@ -103,12 +260,30 @@ def get_record_key(index):
 class TextRecognitionImagePatchDataset:
     _n_samples: int
 
-    def __init__(self, path=None, w_size=128, h_size=32, interpolation=cv2.INTER_CUBIC):
+    def __init__(self, path=None, w_size=128, h_size=32, interpolation=cv2.INTER_CUBIC,
+                 prefetch_depth=1, cache_size=256 * 1024 * 1024, flush_interval=1.0, profile=WRITER):
         self._lmdb = None
+        self._profile = profile
+        self._lmdb_path = None
+        self._layout = None
+        self._metadata = None
+        self._duplicates = None
+        self._label_index = None
+        self._label_index_entry = 0
+        self._edit_log = None
+        self._session = None
+        self._leases = None
+        self._filter = None
+        self._filter_indices = None
+        self._filter_cache = {}
         self._n_samples = 0
         self._w_size = w_size
         self._h_size = h_size
         self._interpolation = interpolation
+        self._display_size = None
+        self._resize_executor = None
+        self._page_cache = PageCache(self._read_patch_list, prefetch_depth, cache_size)
+        self._label_journal = LabelJournal(self._write_labels, flush_interval)
 
         if path is not None:
             self.connect_dataset(path)
@@ -118,85 +293,598 @@ class TextRecognitionImagePatchDataset:
             print('can not find lmdb data: {}'.format(lmdb_path))
             return None
 
-        # self._lmdb = lmdb.open(lmdb_path, max_readers=32, lock=False, readahead=False, meminit=False, create=False)
-        self._lmdb = lmdb.open(lmdb_path, create=False, lock=True, map_size=int(1e9))
+        self._label_journal.flush(wait=True)
+        self._filter = None
+        self._filter_indices = None
+        self._filter_cache = {}
+        self._page_cache.clear()
+        if self._lmdb is not None:
+            self._close_sidecars()
+            self._lmdb.close()
+            self._lmdb = None
+        self._lmdb = open_environment(lmdb_path, self._profile)
         if not self._lmdb:
             print('can not open lmdb from {}'.format(lmdb_path))
             return None
 
-        with self._lmdb.begin(write=False) as txn:
+        try:
+            self._layout = detect_layout(self._lmdb)
+        except ValueError as e:
+            print('can not read lmdb {}: {}'.format(lmdb_path, e))
+            return None
+
+        with begin(self._lmdb) as txn:
             self._n_samples = lmdb_get_int(txn, 'num-samples')
 
         if self._n_samples is None or self._n_samples == 0:
             print('lmdb data set is empty')
             return None
+
+        self._lmdb_path = lmdb_path
+        self._metadata = MetadataIndex.open(metadata_path(lmdb_path))
+        if self._metadata is not None and len(self._metadata) != self._n_samples + 1:
+            print('metadata index of {} is out of date, rebuild it'.format(lmdb_path))
+            self._metadata = None
+        self._duplicates = DuplicateIndex.open(duplicates_path(lmdb_path))
+        if self._duplicates is not None and len(self._duplicates) != self._n_samples + 1:
+            print('duplicate index of {} is out of date, rebuild it'.format(lmdb_path))
+            self._duplicates = None
+        if not is_read_only(self._profile):
+            self._edit_log = EditLog(edit_log_path(lmdb_path))
+            self._session = new_session()
         return True
 
+    @property
+    def metadata(self):
+        return self._metadata
+
+    @property
+    def layout(self):
+        return self._layout
+
+    @property
+    def duplicates(self):
+        return self._duplicates
+
+    @property
+    def label_index(self):
+        # built with one label scan on first use, then kept current by every label write of this dataset
+        if self._label_index is None and self._lmdb is not None:
+            self._label_journal.flush(wait=True)
+            path = label_index_path(self._lmdb_path)
+            txn_id = self._lmdb.info()['last_txnid']
+            label_index = LabelIndex.open(path)
+            if label_index is None or len(label_index) != self._n_samples + 1 or label_index.txn_id != txn_id:
+                label_index = LabelIndex.build(path, self._n_samples + 1, self.iter_labels(), txn_id)
+            self._label_index = label_index
+            self._label_index_entry = self._edit_log.last_id if self._edit_log is not None else 0
+        return self._label_index
+
+    def search_labels(self, query):
+        # sorted indexes of records whose label matches the query, see LabelIndex.search for the syntax
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        return self.label_index.search(query)
+
+    def find_indices(self, label=None, label_regex=None, cluster_of=None):
+        # records matching all given conditions: an exact label, a label regex, the near duplicates of a record
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        if cluster_of is not None and self._duplicates is None:
+            print('build the duplicate index first (tool/build_duplicates.py)')
+            return None
+
+        hits = []
+        if label is not None:
+            hits.append(self.label_index.find_exact(label))
+        if label_regex is not None:
+            if isinstance(label_regex, str):
+                label_regex = re.compile(label_regex)
+            hits.append(self.label_index.find_regex(label_regex))
+        if cluster_of is not None:
+            hits.append(self._duplicates.members(cluster_of))
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        result = hits[0]
+        for other in hits[1:]:
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def iter_labels(self):
+        self._label_journal.flush(wait=True)
+        with begin(self._lmdb) as txn:
+            for index, value in iter_field(txn, self._layout, LABEL):
+                yield index, value.decode('utf-8')
+
+    def iter_raw_records(self, start, end):
+        # (index, encoded image, label, path) without decoding, records missing an image or label are skipped
+        self._label_journal.flush(wait=True)
+        with begin(self._lmdb) as txn:
+            for index, image_bytes, label, path in scan_records(txn, self._layout, range(start, end)):
+                if image_bytes is None or label is None:
+                    continue
+                yield index, image_bytes, label.decode('utf-8'), path.decode('utf-8') if path is not None else None
+
+    def set_filter(self, patch_filter):
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+
+        if patch_filter is None:
+            self._filter = None
+            self._filter_indices = None
+            self._page_cache.clear()
+            return True
+
+        # the resolved list stays fixed while paging, so edits never reorder the review queue
+        indices = self._filter_cache.get(patch_filter.expression)
+        if indices is None:
+            indices = patch_filter.resolve(self)
+            if indices is None:
+                return None
+            self._filter_cache[patch_filter.expression] = indices
+        self._filter = patch_filter
+        self._filter_indices = indices
+        self._page_cache.clear()
+        return True
+
+    @property
+    def filter(self):
+        return self._filter
+
+    @property
+    def filter_indices(self):
+        # sorted record indexes the filtered view pages through, None without a filter
+        return self._filter_indices
+
+    @property
+    def first_index(self):
+        return 0 if self._filter_indices is not None else 1
+
+    def index_at(self, position):
+        if self._filter_indices is None:
+            return position
+        if position >= len(self._filter_indices):
+            return self._n_samples
+        return int(self._filter_indices[position])
+
+    def position_of(self, index):
+        if self._filter_indices is None:
+            return index
+        return int(np.searchsorted(self._filter_indices, index))
+
+    def build_metadata_index(self):
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+
+        self._label_journal.flush(wait=True)
+        metadata = MetadataIndex.create(metadata_path(self._lmdb_path), self._n_samples + 1)
+        with begin(self._lmdb, buffers=True) as txn:
+            for index, value in iter_field(txn, self._layout, IMAGE):
+                if index >= len(metadata):
+                    continue
+                size = get_image_size(value)
+                if size is None:
+                    image = cv2.imdecode(np.frombuffer(value, np.uint8), cv2.IMREAD_UNCHANGED)
+                    if image is None:
+                        continue
+                    size = image.shape[1], image.shape[0]
+                metadata.set_image(index, size[0], size[1], len(value))
+
+            for index, value in iter_field(txn, self._layout, LABEL):
+                label = bytes(value).decode('utf-8')
+                metadata.set_label(index, len(label), label_flags(label))
+
+        metadata.flush()
+        self._metadata = metadata
+        return metadata
+
     def get_label(self, index):
         if self._lmdb is None:
             print('you should open lmdb first before read data ')
             return None
 
-        label_key = lmdb_get_label_key(index)
-        with self._lmdb.begin(write=False) as txn:
-            label = lmdb_get_txt(txn, label_key)
-            return label
+        with begin(self._lmdb) as txn:
+            return self._label_journal.get(index, self._read_label(txn, index))
 
     def resize_image(self, image):
-        height, width, channel = image.shape
-        if height > width/2:
-            ratio = width / float(height)
-            if math.ceil(self._h_size * ratio) > self._w_size:
-                resized_w = self._w_size
-            else:
-                resized_w = math.ceil(self._h_size * ratio)
-            img = cv2.resize(image, (resized_w, self._h_size), self._interpolation)
-            pad_img = np.zeros((self._h_size, self._w_size, 3), dtype=np.uint8)
-            pad_img[:, :resized_w, :] = img  # right pad
-            if self._w_size != resized_w:  # add border Pad
-                pad_img[:, resized_w:, :] = np.repeat(np.expand_dims(img[:, resized_w-1, :], 1),
-                                                      self._w_size - resized_w, axis=1)
-            return pad_img
+        return self.resize_images([image])[0]
+
+    def target_widths(self, images):
+        # patches taller than half their width keep their aspect ratio and get border padded on the right
+        shapes = np.array([image.shape[:2] for image in images], dtype=np.float64).reshape(-1, 2)
+        heights, widths = shapes[:, 0], shapes[:, 1]
+        keep_ratio = heights > widths / 2
+        ratio_widths = np.ceil(self._h_size * widths / np.maximum(heights, 1))
+        resized_widths = np.where(keep_ratio, np.minimum(ratio_widths, self._w_size), self._w_size)
+        return np.maximum(resized_widths, 1).astype(np.int64)
+
+    def resize_images(self, images, out=None, workers=4):
+        if out is None:
+            out = np.empty((len(images), self._h_size, self._w_size, 3), dtype=np.uint8)
+        resized_widths = self.target_widths(images)
+
+        def resize_one(i):
+            image = images[i]
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            elif image.shape[2] == 4:
+                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+            resized_w = int(resized_widths[i])
+            if resized_w == self._w_size:
+                cv2.resize(image, (self._w_size, self._h_size), dst=out[i], interpolation=self._interpolation)
+                return
+            out[i, :, :resized_w] = cv2.resize(image, (resized_w, self._h_size), interpolation=self._interpolation)
+            out[i, :, resized_w:] = out[i, :, resized_w - 1:resized_w]  # border pad
+
+        # cv2.resize releases the GIL, so a few threads keep several cores busy
+        if workers > 1 and len(images) > 1:
+            list(self._resize_pool(workers).map(resize_one, range(len(images))))
         else:
-            img = cv2.resize(image, (self._w_size, self._h_size), self._interpolation)
-            return img
+            for i in range(len(images)):
+                resize_one(i)
+        return out
+
+    def _resize_pool(self, workers):
+        if self._resize_executor is None or self._resize_executor._max_workers != workers:
+            if self._resize_executor is not None:
+                self._resize_executor.shutdown()
+            self._resize_executor = ThreadPoolExecutor(max_workers=workers)
+        return self._resize_executor
+
+    def set_display_size(self, display_size):
+        # pages are read with their images decoded to fit (width, height), None keeps them encoded only
+        if display_size != self._display_size:
+            self._display_size = display_size
+            self._page_cache.clear()
 
     def get_patch_list(self, count, start=0):
         if self._lmdb is None:
             print('you should open lmdb first before read data ')
             return None
 
+        self._label_journal.flush()
+        image_patch_list = self._page_cache.get(start, count)
+        self._page_cache.prefetch(self._adjacent_pages(count, start))
+        return image_patch_list
+
+    def _adjacent_pages(self, count, start):
+        pages = []
+        for step in range(1, self._page_cache.depth + 1):
+            if start + step * count < self.patch_count:
+                pages.append((start + step * count, count))
+            if start - step * count >= 0:
+                pages.append((start - step * count, count))
+        return pages
+
+    def _read_patch_list(self, start, count):
         image_patch_list = []
-        # start = start + 0
-        end = min(start + count, self._n_samples)
-        with self._lmdb.begin(write=False) as txn:
-            for i in range(start, end):
-                image_key, label_key, path_key = get_record_key(i)
-                im = lmdb_get_image(txn, image_key)
-                # im = self.resize_image(im)
-                # im = cv2.resize(im, (128, 32))
-                label = lmdb_get_txt(txn, label_key)
-                file_path = lmdb_get_txt(txn, path_key)                 
-                patch = ImagePatchData(i, im, label, file_path)
+        if self._filter_indices is not None:
+            indices = self._filter_indices[start:start + count].tolist()
+        else:
+            # start = start + 0
+            indices = range(start, min(start + count, self._n_samples))
+        with begin(self._lmdb, buffers=True) as txn:
+            for i, image_bytes, label, file_path in scan_records(txn, self._layout, indices):
+                image_size = display = None
+                if image_bytes is not None:
+                    image_size = get_image_size(image_bytes)
+                    image_bytes = bytes(image_bytes)
+                    # decoded here, on the page loader or prefetch thread, and only to the size it is shown at
+                    if self._display_size is not None:
+                        display, image_size = decode_display_image(image_bytes, image_size, *self._display_size)
+                label = self._label_journal.get(i, bytes(label).decode('utf-8') if label is not None else None)
+                file_path = bytes(file_path).decode('utf-8') if file_path is not None else None
+                patch = ImagePatchData(i, image_bytes, label, file_path, image_size, display)
                 image_patch_list.append(patch)
 
         return image_patch_list
 
     @property
     def patch_count(self):
+        if self._filter_indices is not None:
+            return len(self._filter_indices)
+        return self._n_samples
+
+    @property
+    def sample_count(self):
+        # records in the lmdb, whatever the filter
         return self._n_samples
 
     def set_label(self, index, label):
         if self._lmdb is None:
             print('you should open lmdb first before read data ')
             return None
+        if is_read_only(self._profile):
+            print('lmdb is opened read only, label of {} is not saved'.format(index))
+            return None
+
+        self._label_journal.put(index, label)
+        self._page_cache.update_label(index, label)
+        if self._metadata is not None:
+            self._metadata.set_label(index, len(label), label_flags(label), edited=True)
+        if self._label_index is not None:
+            self._label_index.update([index], label)
+
+    def set_cluster_label(self, index, label):
+        # labels every near duplicate of the record in one batched write
+        if self._duplicates is None or index >= len(self._duplicates):
+            return self.set_label(index, label)
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        if is_read_only(self._profile):
+            print('lmdb is opened read only, label of {} is not saved'.format(index))
+            return None
+
+        members = [int(member) for member in self._duplicates.members(index)]
+        self._label_journal.put_many({member: label for member in members})
+        for member in members:
+            self._page_cache.update_label(member, label)
+            if self._metadata is not None:
+                self._metadata.set_label(member, len(label), label_flags(label), edited=True)
+        if self._label_index is not None:
+            self._label_index.update(members, label)
+        return len(members)
+
+    def relabel(self, indices, label, batch_size=100000):
+        # rewrites many labels in a few large transactions, undone as one step
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        if is_read_only(self._profile):
+            print('lmdb is opened read only, labels are not saved')
+            return None
+        return self.apply_edits([(int(index), None, label) for index in np.unique(indices)], batch_size=batch_size)
+
+    def undo(self):
+        # reverts the last edit, bulk relabel, revert or replay. records changed again since are left alone
+        if self._edit_log is None:
+            print('lmdb is opened read only, labels are not saved')
+            return None
+        self._label_journal.flush(wait=True)
+        group = self._edit_log.undo_group(self._session)
+        if group is None:
+            return 0
+        targets = [(index, new, old) for entry in reversed(list(self._edit_log.entries(group)))
+                   for index, old, new in reversed(entry['edits'])]
+        return self.apply_edits(targets, UNDO, group, log_empty=True)
+
+    def redo(self):
+        if self._edit_log is None:
+            print('lmdb is opened read only, labels are not saved')
+            return None
+        self._label_journal.flush(wait=True)
+        group = self._edit_log.redo_group(self._session)
+        if group is None:
+            return 0
+        targets = [(index, old, new) for entry in self._edit_log.entries(group) for index, old, new in entry['edits']]
+        return self.apply_edits(targets, REDO, group, log_empty=True)
+
+    def revert_session(self, session):
+        # puts back the labels every record had before the session touched it, unless changed after it
+        if self._edit_log is None:
+            print('lmdb is opened read only, labels are not saved')
+            return None
+        self._label_journal.flush(wait=True)
+        return self.apply_edits([(index, new, old) for index, (old, new) in
+                                 net_edits(self._edit_log.entries(self._edit_log.session_entries(session))).items()],
+                                REVERT, session)
+
+    @property
+    def edit_log(self):
+        return self._edit_log
 
-        label_key = lmdb_get_label_key(index)
-        with self._lmdb.begin(write=True) as txn:
-            lmdb_put_text(txn, label_key, label)
+    def lease_table(self, ttl=1800.0, name=LEASE_DB):
+        # index range leases of the labelers sharing this lmdb
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        if is_read_only(self._profile):
+            print('lmdb is opened read only, no range can be leased')
+            return None
+        if name != LEASE_DB:
+            return LeaseTable(self._lmdb, self._n_samples, ttl=ttl, name=name)
+        if self._leases is None:
+            self._leases = LeaseTable(self._lmdb, self._n_samples, ttl=ttl)
+        return self._leases
+
+    @property
+    def session(self):
+        return self._session
+
+    def apply_edits(self, targets, op=EDIT, target=None, batch_size=100000, log_empty=False):
+        # targets are (index, expected current label or None for any, new label), applied in order.
+        # the net change is written in transactions of batch_size records and logged as one group once committed
+        self._label_journal.flush(wait=True)
+        before = {}
+        after = {}
+        with begin(self._lmdb) as txn:
+            for index, expected, label in targets:
+                if index not in after:
+                    before[index] = after[index] = self._read_label(txn, index)
+                current = after[index]
+                if current is None or (expected is not None and current != expected):
+                    continue
+                after[index] = label
+        edits = [(index, before[index], label) for index, label in after.items() if label != before[index]]
+        if not edits:
+            if log_empty:
+                self._edit_log.append(edits, self._session, op, target)
+            return 0
+
+        # a retried batch is written again but logged once, a batch that never commits is not logged at all
+        written = 0
+        try:
+            for start in range(0, len(edits), batch_size):
+                labels = {index: label for index, _, label in edits[start:start + batch_size]}
+                write_with_retry(self._lmdb, lambda txn: self._put_labels(txn, labels))
+                written = min(start + batch_size, len(edits))
+        finally:
+            if written > 0:
+                self._edit_log.append(edits[:written], self._session, op, target)
+        self._page_cache.clear()
+
+        by_label = {}
+        for index, _, label in edits:
+            by_label.setdefault(label, []).append(index)
+            if self._metadata is not None:
+                self._metadata.set_label(index, len(label), label_flags(label), edited=True)
+        if self._label_index is not None:
+            for label, indices in by_label.items():
+                self._label_index.update(indices, label)
+        return len(edits)
+
+    def diff_labels(self, other_path, base_path=None):
+        # (index, mine, theirs, base, resolution) of every record whose label differs in the other copy, found by
+        # walking the label keys of both lmdbs with cursors. base is the label both copies started from, read
+        # from base_path (a copy taken when they split) or else from the edits both sides logged since then
+        if self._lmdb is None:
+            print('you should open lmdb first before read data ')
+            return None
+        for path in (other_path, base_path):
+            if path is not None and not os.path.exists(path):
+                print('can not find lmdb data: {}'.format(path))
+                return None
+            if path is not None and os.path.abspath(path) == os.path.abspath(self._lmdb_path):
+                print('{} is the open lmdb itself'.format(path))
+                return None
+        self._label_journal.flush(wait=True)
+        return self._iter_label_diff(other_path, base_path)
+
+    def _iter_label_diff(self, other_path, base_path):
+        base_labels = self._logged_base_labels(other_path) if base_path is None else None
+        other = open_environment(other_path, VIEWER)
+        base = open_environment(base_path, VIEWER) if base_path is not None else None
+        try:
+            other_layout = detect_layout(other)
+            base_layout = detect_layout(base) if base is not None else None
+            with begin(self._lmdb) as txn, begin(other) as other_txn:
+                base_txn = begin(base) if base is not None else None
+                for index, mine, theirs in diff_label_streams(iter_field(txn, self._layout, LABEL),
+                                                              iter_field(other_txn, other_layout, LABEL)):
+                    mine = mine.decode('utf-8') if mine is not None else None
+                    theirs = theirs.decode('utf-8') if theirs is not None else None
+                    if base_txn is not None:
+                        origin = base_layout.get(base_txn, LABEL, index)
+                        origin = origin.decode('utf-8') if origin is not None else None
+                    else:
+                        origin = base_labels.get(index)
+                    yield index, mine, theirs, origin, merge_resolution(mine, theirs, origin)
+                if base_txn is not None:
+                    base_txn.abort()
+        finally:
+            other.close()
+            if base is not None:
+                base.close()
+
+    def _logged_base_labels(self, other_path):
+        # the label a record had before the first edit either copy logged after their logs diverged
+        opened = []
+        mine_log = self._edit_log
+        if mine_log is None and os.path.exists(edit_log_path(self._lmdb_path)):
+            mine_log = EditLog(edit_log_path(self._lmdb_path))
+            opened.append(mine_log)
+        other_log = None
+        if os.path.exists(edit_log_path(other_path)):
+            other_log = EditLog(edit_log_path(other_path))
+            opened.append(other_log)
+        logs = [log for log in (mine_log, other_log) if log is not None]
+        shared = logs[0].common_prefix(logs[1]) if len(logs) == 2 else 0
+        base_labels = {}
+        for log in logs:
+            for index, (old, _) in net_edits(log.entries(range(shared + 1, log.last_id + 1))).items():
+                base_labels.setdefault(index, old)
+        for log in opened:
+            log.close()
+        return base_labels
+
+    def merge_labels(self, other_path, base_path=None, prefer=KEEP_MINE, batch_size=100000):
+        # takes every label only the other copy changed, in a few large transactions undone as one step.
+        # conflicting records keep their label unless prefer is TAKE_THEIRS.
+        # returns (records changed, conflicts as (index, mine, theirs, base))
+        if is_read_only(self._profile):
+            print('lmdb is opened read only, labels are not saved')
+            return None
+        diff = self.diff_labels(other_path, base_path)
+        if diff is None:
+            return None
+        targets = []
+        conflicts = []
+        for index, mine, theirs, base, resolution in diff:
+            if resolution == CONFLICT:
+                conflicts.append((index, mine, theirs, base))
+                if prefer != TAKE_THEIRS:
+                    continue
+            elif resolution == KEEP_MINE:
+                continue
+            if mine is not None and theirs is not None:
+                targets.append((index, mine, theirs))
+        return self.apply_edits(targets, MERGE, os.path.abspath(other_path), batch_size), conflicts
+
+    def flush_labels(self):
+        self._label_journal.flush(wait=True)
+
+    def _write_labels(self, labels):
+        # the journal's writer, old labels are read in the same transaction. the edits are logged once the
+        # transaction committed, a retry after the map grew reads and writes them again
+        def write(txn):
+            edits = []
+            for index in sorted(labels):
+                old = self._read_label(txn, index)
+                if old != labels[index]:
+                    edits.append((index, old, labels[index]))
+            self._put_labels(txn, labels)
+            return edits
+
+        edits = write_with_retry(self._lmdb, write)
+        if edits and self._edit_log is not None:
+            self._edit_log.append(edits, self._session)
+
+    def _read_label(self, txn, index):
+        label = self._layout.get(txn, LABEL, index)
+        return bytes(label).decode('utf-8') if label is not None else None
+
+    def _put_labels(self, txn, labels):
+        for index in sorted(labels):
+            if not self._layout.put(txn, LABEL, index, labels[index].encode()):
+                print('cannot write label {}: {}'.format(index, labels[index]))
+                sys.exit()
 
     def set_deleted_mark(self, index):
-        self.set_label(index, '__#TO_BE_DELETED#__')
+        self.set_label(index, TO_BE_DELETED_LABEL)
+
+    def close(self):
+        self._label_journal.close()
+        self._page_cache.close()
+        if self._resize_executor is not None:
+            self._resize_executor.shutdown()
+            self._resize_executor = None
+        if self._lmdb is not None:
+            self._close_sidecars()
+            self._lmdb.close()
+            self._lmdb = None
+
+    def _close_sidecars(self):
+        if self._metadata is not None:
+            self._metadata.flush()
+        if self._duplicates is not None:
+            self._duplicates.flush()
+        if self._label_index is not None:
+            # labels written by other labelers sharing the lmdb are not in the index, the next open rebuilds it
+            shared = self._edit_log is not None and \
+                self._edit_log.has_other_sessions(self._label_index_entry, self._session)
+            self._label_index.flush(-1 if shared else self._lmdb.info()['last_txnid'])
+        if self._edit_log is not None:
+            self._edit_log.close()
+        self._metadata = None
+        self._duplicates = None
+        self._label_index = None
+        self._edit_log = None
+        self._leases = None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+import numpy as np
+
+NO_LABEL = -1
+NGRAM = 3
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+
+def label_index_path(lmdb_path):
+    return os.path.join(lmdb_path, 'label_index')
+
+
+def ngram_codes(text):
+    # every 3 character window packed into one int64, 21 bits per unicode code point
+    return {(ord(text[i]) << 42) | (ord(text[i + 1]) << 21) | ord(text[i + 2]) for i in range(len(text) - NGRAM + 1)}
+
+
+def required_literals(pattern):
+    # plain character runs that every match of the regex must contain. patterns with groups or
+    # alternation are not analysed, they fall back to a scan over the distinct labels
+    if '|' in pattern or '(' in pattern:
+        return []
+    literals = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' or char in REGEX_SPECIAL:
+            if char in '?*{' and run:
+                run = run[:-1]
+            if run:
+                literals.append(run)
+            run = ''
+            if char in '[{':
+                i = pattern.find(']' if char == '[' else '}', i + 2 if char == '[' else i)
+                if i < 0:
+                    return []
+            elif char == '\\':
+                i += 1
+        else:
+            run += char
+        i += 1
+    if run:
+        literals.append(run)
+    return literals
+
+
+# trigram inverted index over the label vocabulary: the postings of the indexed labels are stored as
+# sorted codes, offsets and label ids, labels added since then are held in a small in memory delta
+class NgramIndex:
+    def __init__(self, codes, offsets, label_ids, indexed_count):
+        self._codes = codes
+        self._offsets = offsets
+        self._label_ids = label_ids
+        self._indexed_count = indexed_count
+        self._delta = {}
+
+    @classmethod
+    def build(cls, vocabulary):
+        index = cls(np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32), 0)
+        for label_id in range(len(vocabulary)):
+            index.add(label_id, vocabulary[label_id])
+        index.merge()
+        return index
+
+    @classmethod
+    def open(cls, path, vocabulary, indexed_count):
+        files = [os.path.join(path, name + '.npy') for name in ('ngram_codes', 'ngram_offsets', 'ngram_label_ids')]
+        if not all(os.path.exists(file) for file in files) or indexed_count > len(vocabulary):
+            return cls.build(vocabulary)
+        index = cls(*[np.load(file) for file in files], indexed_count)
+        for label_id in range(indexed_count, len(vocabulary)):
+            index.add(label_id, vocabulary[label_id])
+        return index
+
+    def add(self, label_id, label):
+        for code in ngram_codes(label):
+            self._delta.setdefault(code, []).append(label_id)
+        self._indexed_count = max(self._indexed_count, label_id + 1)
+
+    def postings(self, code):
+        i = np.searchsorted(self._codes, code)
+        ids = self._label_ids[self._offsets[i]:self._offsets[i + 1]] if i < len(self._codes) and \
+            self._codes[i] == code else np.empty(0, dtype=np.int32)
+        delta = self._delta.get(code)
+        if delta:
+            ids = np.unique(np.concatenate([ids, np.array(delta, dtype=np.int32)]))
+        return ids
+
+    def candidates(self, text):
+        # label ids containing every trigram of text, None when text is too short to narrow anything down
+        codes = ngram_codes(text)
+        if not codes:
+            return None
+        result = None
+        for code in sorted(codes, key=lambda code: len(self.postings(code))):
+            ids = self.postings(code)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def merge(self):
+        # folds the delta into the sorted arrays
+        if not self._delta:
+            return
+        delta_codes = np.array([code for code, ids in self._delta.items() for _ in ids], dtype=np.int64)
+        delta_ids = np.array([label_id for ids in self._delta.values() for label_id in ids], dtype=np.int32)
+        counts = np.diff(self._offsets)
+        codes = np.concatenate([np.repeat(self._codes, counts), delta_codes])
+        label_ids = np.concatenate([self._label_ids, delta_ids])
+        order = np.lexsort((label_ids, codes))
+        codes = codes[order]
+        self._label_ids = label_ids[order]
+        self._codes, starts = np.unique(codes, return_index=True)
+        self._offsets = np.append(starts, len(codes)).astype(np.int64)
+        self._delta = {}
+
+    def save(self, path):
+        self.merge()
+        for name, array in (('ngram_codes', self._codes), ('ngram_offsets', self._offsets),
+                            ('ngram_label_ids', self._label_ids)):
+            np.save(os.path.join(path, name + '.tmp.npy'), array)
+            os.replace(os.path.join(path, name + '.tmp.npy'), os.path.join(path, name + '.npy'))
+        return self._indexed_count
+
+
+# inverted label index: every distinct label gets an id, row i of a memory mapped column holds the id of
+# record i. a lookup is a vectorized scan of the id column, which stays fast at millions of records and
+# is kept current by writing a single id per edit
+class LabelIndex:
+    def __init__(self, path, label_ids, vocabulary, txn_id=None, ngrams=None):
+        self._path = path
+        self._label_ids = label_ids
+        self._vocabulary = vocabulary
+        self._ids = {label: label_id for label_id, label in enumerate(vocabulary)}
+        self._txn_id = txn_id
+        self._ngrams = ngrams if ngrams is not None else NgramIndex.build(vocabulary)
+
+    @classmethod
+    def create(cls, path, size):
+        os.makedirs(path, exist_ok=True)
+        label_ids = np.lib.format.open_memmap(os.path.join(path, 'label_ids.npy'), mode='w+', dtype=np.int32,
+                                              shape=(size,))
+        label_ids[:] = NO_LABEL
+        return cls(path, label_ids, [])
+
+    @classmethod
+    def build(cls, path, size, labels, txn_id=None):
+        index = cls.create(path, size)
+        for i, label in labels:
+            if i < size:
+                index._label_ids[i] = index.label_id(label)
+        index._txn_id = txn_id
+        index.flush()
+        return index
+
+    @classmethod
+    def open(cls, path):
+        ids_path = os.path.join(path, 'label_ids.npy')
+        vocabulary_path = os.path.join(path, 'vocabulary.json')
+        if not os.path.exists(ids_path) or not os.path.exists(vocabulary_path):
+            return None
+        with open(vocabulary_path, encoding='utf-8') as f:
+            state = json.load(f)
+        ngrams = NgramIndex.open(path, state['vocabulary'], state.get('ngram_count', len(state['vocabulary']) + 1))
+        return cls(path, np.load(ids_path, mmap_mode='r+'), state['vocabulary'], state.get('txn_id'), ngrams)
+
+    def __len__(self):
+        return len(self._label_ids)
+
+    @property
+    def txn_id(self):
+        # id of the last lmdb transaction the index has seen, a different one means somebody else wrote labels
+        return self._txn_id
+
+    @property
+    def vocabulary(self):
+        return self._vocabulary
+
+    def label_id(self, label):
+        label_id = self._ids.get(label)
+        if label_id is None:
+            label_id = len(self._vocabulary)
+            self._vocabulary.append(label)
+            self._ids[label] = label_id
+            self._ngrams.add(label_id, label)
+        return label_id
+
+    def label_of(self, index):
+        label_id = int(self._label_ids[index])
+        return None if label_id == NO_LABEL else self._vocabulary[label_id]
+
+    def update(self, indices, label):
+        indices = np.asarray(indices, dtype=np.int64)
+        self._label_ids[indices[indices < len(self)]] = self.label_id(label)
+
+    def find_exact(self, label):
+        label_id = self._ids.get(label)
+        if label_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self._label_ids == label_id)
+
+    def find_ids(self, label_ids):
+        if len(label_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        if len(label_ids) == 1:
+            return np.flatnonzero(self._label_ids == label_ids[0])
+        return np.flatnonzero(np.isin(self._label_ids, np.asarray(label_ids, dtype=np.int32)))
+
+    def search(self, query):
+        # =EXACT   PREFIX*   /REGEX   anything else is a substring search
+        if query.startswith('='):
+            return self.find_exact(query[1:])
+        if query.startswith('/'):
+            return self.find_regex(re.compile(query[1:]))
+        if query.endswith('*'):
+            return self.find_prefix(query[:-1])
+        return self.find_substring(query)
+
+    def find_prefix(self, prefix):
+        return self.find_ids(self._match_labels(prefix, lambda label: label.startswith(prefix)))
+
+    def find_substring(self, text):
+        return self.find_ids(self._match_labels(text, lambda label: text in label))
+
+    def find_regex(self, pattern):
+        # the trigrams of the literal parts of the regex select candidate labels, the regex only checks those
+        literal = ''
+        if not pattern.flags & re.IGNORECASE:
+            literal = max(required_literals(pattern.pattern), key=len, default='')
+        return self.find_ids(self._match_labels(literal, lambda label: pattern.search(label) is not None))
+
+    def _match_labels(self, text, match):
+        candidates = self._ngrams.candidates(text)
+        if candidates is None:
+            candidates = range(len(self._vocabulary))
+        return [int(label_id) for label_id in candidates if match(self._vocabulary[label_id])]
+
+    def flush(self, txn_id=None):
+        if txn_id is not None:
+            self._txn_id = txn_id
+        self._label_ids.flush()
+        ngram_count = self._ngrams.save(self._path)
+        vocabulary_path = os.path.join(self._path, 'vocabulary.json')
+        with open(vocabulary_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'txn_id': self._txn_id, 'ngram_count': ngram_count, 'vocabulary': self._vocabulary}, f,
+                      ensure_ascii=False)
+        os.replace(vocabulary_path + '.tmp', vocabulary_path)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+# Write-behind buffer for label edits. Edits to the same index are merged and the
+# writer is called with the whole batch at most flush_interval seconds after the first edit.
+class LabelJournal:
+    def __init__(self, writer, flush_interval=1.0):
+        self._writer = writer
+        self._flush_interval = flush_interval
+        self._pending = {}
+        self._flushing = {}
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def pending_count(self):
+        with self._condition:
+            return len(self._pending) + len(self._flushing)
+
+    def put(self, index, label):
+        self.put_many({index: label})
+
+    def put_many(self, labels):
+        # the edits land in the same batch, so they are written in one transaction
+        if self._flush_interval <= 0:
+            with self._condition:
+                self._pending.update(labels)
+            self._flush_pending()
+            return
+
+        with self._condition:
+            self._pending.update(labels)
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name='label-journal', daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def get(self, index, default=None):
+        with self._condition:
+            if index in self._pending:
+                return self._pending[index]
+            return self._flushing.get(index, default)
+
+    def flush(self, wait=False):
+        if wait or self._worker is None:
+            self._flush_pending()
+            return
+
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self._flush_pending()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+
+                deadline = time.monotonic() + self._flush_interval
+                while not self._flush_requested and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                self._flush_requested = False
+
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with self._flush_lock:
+            with self._condition:
+                batch = self._pending
+                self._pending = {}
+                self._flushing = batch
+            if not batch:
+                return
+
+            try:
+                self._writer(batch)
+            except Exception as e:
+                print('label journal flush failed: {}'.format(e))
+                with self._condition:
+                    for index, label in batch.items():
+                        self._pending.setdefault(index, label)
+            finally:
+                with self._condition:
+                    self._flushing = {}
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import getpass
+import json
+import socket
+import time
+
+from LmdbConfig import begin, write_with_retry
+
+LEASE_DB = b'leases'
+NEXT_START_KEY = b'next-start'
+
+
+def default_owner():
+    return '{}@{}'.format(getpass.getuser(), socket.gethostname())
+
+
+class Lease:
+    def __init__(self, start, stop, owner, expires, done=False):
+        self.start = start
+        self.stop = stop
+        self.owner = owner
+        self.expires = expires
+        self.done = done
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(**json.loads(bytes(data).decode('utf-8')))
+
+    def to_bytes(self):
+        return json.dumps(self.__dict__).encode('utf-8')
+
+    def key(self):
+        return b'%09d' % self.start
+
+    def is_active(self, now):
+        return not self.done and self.expires > now
+
+    def __repr__(self):
+        return 'Lease({}:{} {}{})'.format(self.start, self.stop, self.owner, ' done' if self.done else '')
+
+
+# lease table in a sub-database of the shared lmdb. every labeler session leases a disjoint index
+# range [start, stop), a lease that is not renewed within its ttl can be taken over by someone else.
+# all changes happen in one write transaction, so lmdb's writer lock is the only coordination needed
+class LeaseTable:
+    def __init__(self, env, record_count, first_index=1, ttl=1800.0, name=LEASE_DB):
+        self._env = env
+        self._record_count = record_count
+        self._first_index = first_index
+        self._ttl = ttl
+        self._db = env.open_db(name)
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def _leases(self, txn):
+        cursor = txn.cursor(db=self._db)
+        if not cursor.set_range(b'0'):
+            return []
+        return [Lease.from_bytes(value) for key, value in cursor if key != NEXT_START_KEY]
+
+    def leases(self):
+        with begin(self._env) as txn:
+            return self._leases(txn)
+
+    def acquire(self, owner, size=1000):
+        # the owner's own open lease, else an expired one, else a new range behind every range leased so far
+        def write(txn):
+            now = time.time()
+            leases = self._leases(txn)
+            mine = [lease for lease in leases if lease.owner == owner and not lease.done]
+            expired = [lease for lease in leases if not lease.done and lease.expires <= now]
+            if mine:
+                lease = mine[0]
+            elif expired:
+                lease = expired[0]
+            else:
+                start = txn.get(NEXT_START_KEY, db=self._db)
+                start = int(start) if start is not None else self._first_index
+                if start > self._record_count:
+                    return None
+                lease = Lease(start, min(start + size, self._record_count + 1), owner, now)
+                txn.put(NEXT_START_KEY, str(lease.stop).encode(), db=self._db)
+            lease.owner = owner
+            lease.expires = now + self._ttl
+            txn.put(lease.key(), lease.to_bytes(), db=self._db)
+            return lease
+        return write_with_retry(self._env, write)
+
+    def renew(self, lease):
+        # a heartbeat, fails when the lease expired and was taken over meanwhile
+        return self._update(lease, lambda current, now: setattr(current, 'expires', now + self._ttl))
+
+    def release(self, lease, done=True):
+        # done ranges are never handed out again, released unfinished ones go to the next labeler
+        def change(current, now):
+            current.done = done
+            current.expires = now
+        return self._update(lease, change)
+
+    def _update(self, lease, change):
+        def write(txn):
+            data = txn.get(lease.key(), db=self._db)
+            if data is None:
+                return None
+            current = Lease.from_bytes(data)
+            if current.owner != lease.owner or current.done:
+                return None
+            change(current, time.time())
+            txn.put(current.key(), current.to_bytes(), db=self._db)
+            return current
+        return write_with_retry(self._env, write)
+
+    def clear(self):
+        write_with_retry(self._env, lambda txn: txn.drop(self._db, delete=False))
+
+    def progress(self):
+        # (done, actively leased, not handed out yet) record counts
+        now = time.time()
+        leases = self.leases()
+        done = sum(lease.stop - lease.start for lease in leases if lease.done)
+        active = sum(lease.stop - lease.start for lease in leases if lease.is_active(now))
+        return done, active, self._record_count - self._first_index + 1 - done - active
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import lmdb
+
+GB = 1024 * 1024 * 1024
+
+VIEWER = 'viewer'
+READER = 'reader'
+WRITER = 'writer'
+BULK_WRITER = 'bulk_writer'
+
+# viewer:      read only, keeps the lock table so it sees commits of a labeler working on the same lmdb
+# reader:      read only and lock free, for training loaders and tool workers in many processes
+# writer:      the labeler, several labeler processes may share a lmdb, each writing in short transactions
+# bulk_writer: a tool filling a lmdb nobody else has open
+# max_dbs leaves room for sub-databases: the record fields of layout version 2 and the lease table
+PROFILES = {
+    VIEWER: dict(readonly=True, lock=True, max_readers=32, meminit=False, max_dbs=8),
+    READER: dict(readonly=True, lock=False, max_readers=126, meminit=False, max_dbs=8),
+    WRITER: dict(readonly=False, lock=True, max_readers=32, meminit=False, max_dbs=8),
+    BULK_WRITER: dict(readonly=False, lock=False, max_readers=32, meminit=False, max_dbs=8),
+}
+
+
+def data_file_size(lmdb_path):
+    data_path = os.path.join(lmdb_path, 'data.mdb')
+    if not os.path.exists(data_path):
+        return 0
+    return os.path.getsize(data_path)
+
+
+def map_size_for(lmdb_path, growth=GB):
+    size = data_file_size(lmdb_path)
+    return size + max(growth, size // 2)
+
+
+def open_environment(lmdb_path, profile=WRITER, sequential=False, map_size=None, create=False):
+    # readahead only pays off when records are read in key order
+    options = dict(PROFILES[profile])
+    options['readahead'] = sequential
+    if not options['readonly']:
+        options['map_size'] = map_size if map_size is not None else map_size_for(lmdb_path)
+    if create:
+        os.makedirs(lmdb_path, exist_ok=True)
+    return lmdb.open(lmdb_path, create=create, **options)
+
+
+def is_read_only(profile):
+    return PROFILES[profile]['readonly']
+
+
+def grow_map(env, growth=GB):
+    map_size = env.info()['map_size']
+    env.set_mapsize(map_size + max(growth, map_size // 2))
+
+
+def begin(env, write=False, buffers=False):
+    # another process grew the map since this environment was opened, adopt its size and retry
+    try:
+        return env.begin(write=write, buffers=buffers)
+    except lmdb.MapResizedError:
+        env.set_mapsize(0)
+        return env.begin(write=write, buffers=buffers)
+
+
+def write_with_retry(env, write, growth=GB):
+    while True:
+        try:
+            with begin(env, write=True) as txn:
+                return write(txn)
+        except lmdb.MapFullError:
+            grow_map(env, growth)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+
+FLAG_MISSING = 1
+FLAG_TO_BE_DELETED = 2
+FLAG_DELETED = 4
+FLAG_EDITED = 8
+
+COLUMNS = [('width', np.uint32), ('height', np.uint32), ('aspect_ratio', np.float32),
+           ('label_length', np.uint32), ('byte_size', np.uint32), ('flags', np.uint8)]
+
+
+def metadata_path(lmdb_path):
+    return os.path.join(lmdb_path, 'metadata')
+
+
+# one memory mapped .npy file per column, row i describes record i
+class MetadataIndex:
+    def __init__(self, path, columns):
+        self._path = path
+        self._columns = columns
+
+    @classmethod
+    def create(cls, path, size):
+        os.makedirs(path, exist_ok=True)
+        columns = {}
+        for name, dtype in COLUMNS:
+            columns[name] = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                                      dtype=dtype, shape=(size,))
+        columns['flags'][:] = FLAG_MISSING
+        return cls(path, columns)
+
+    @classmethod
+    def open(cls, path):
+        columns = {}
+        for name, _ in COLUMNS:
+            column_path = os.path.join(path, name + '.npy')
+            if not os.path.exists(column_path):
+                return None
+            columns[name] = np.load(column_path, mmap_mode='r+')
+        return cls(path, columns)
+
+    def __len__(self):
+        return len(self._columns['flags'])
+
+    @property
+    def width(self):
+        return self._columns['width']
+
+    @property
+    def height(self):
+        return self._columns['height']
+
+    @property
+    def aspect_ratio(self):
+        return self._columns['aspect_ratio']
+
+    @property
+    def label_length(self):
+        return self._columns['label_length']
+
+    @property
+    def byte_size(self):
+        return self._columns['byte_size']
+
+    @property
+    def flags(self):
+        return self._columns['flags']
+
+    def set_image(self, index, width, height, byte_size):
+        self._columns['width'][index] = width
+        self._columns['height'][index] = height
+        self._columns['aspect_ratio'][index] = width / height if height > 0 else 0
+        self._columns['byte_size'][index] = byte_size
+        self._columns['flags'][index] &= np.uint8(~FLAG_MISSING & 0xFF)
+
+    def set_label(self, index, label_length, flags, edited=False):
+        if index >= len(self):
+            return
+        self._columns['label_length'][index] = label_length
+        keep = self._columns['flags'][index] & (FLAG_MISSING | FLAG_EDITED)
+        if edited:
+            keep |= FLAG_EDITED
+        self._columns['flags'][index] = keep | flags
+
+    def pixels_per_char(self):
+        return self.width / np.maximum(self.label_length, 1)
+
+    def valid_mask(self):
+        return (self.flags & (FLAG_MISSING | FLAG_TO_BE_DELETED | FLAG_DELETED)) == 0
+
+    def suspicious_mask(self, min_pixels_per_char=5):
+        return self.valid_mask() & (self.pixels_per_char() < min_pixels_per_char)
+
+    @staticmethod
+    def find_next(mask, index):
+        hits = np.flatnonzero(mask[index + 1:])
+        if len(hits) == 0:
+            return None
+        return index + 1 + int(hits[0])
+
+    @staticmethod
+    def find_prev(mask, index):
+        hits = np.flatnonzero(mask[:max(index, 0)])
+        if len(hits) == 0:
+            return None
+        return int(hits[-1])
+
+    def flush(self):
+        for column in self._columns.values():
+            column.flush()
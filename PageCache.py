@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+
+
+def patch_list_size(patch_list):
+    size = 0
+    for patch in patch_list:
+        size += patch.nbytes
+        if patch.label is not None:
+            size += len(patch.label)
+        if patch.file_path is not None:
+            size += len(patch.file_path)
+    return size
+
+
+# LRU cache of decoded pages keyed by (start, count), pages passed to prefetch() are read on a worker thread
+class PageCache:
+    def __init__(self, loader, depth=1, max_bytes=256 * 1024 * 1024):
+        self._loader = loader
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._wanted = []
+        self._loading = None
+        self._in_flight = 0
+        self._edit_log = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = None
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def get(self, start, count):
+        key = (start, count)
+        with self._condition:
+            while self._loading == key:
+                self._condition.wait()
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                return list(self._pages[key][0])
+            generation, mark = self._begin_load()
+
+        patch_list = None
+        try:
+            patch_list = self._loader(start, count)
+        finally:
+            with self._condition:
+                self._end_load(key, patch_list, generation, mark)
+        return list(patch_list)
+
+    def prefetch(self, keys):
+        if self._depth <= 0:
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._wanted = [key for key in keys if key not in self._pages]
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='page-prefetch', daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def update_label(self, index, label):
+        with self._condition:
+            if self._in_flight > 0:
+                self._edit_log.append((index, label))
+            for patch_list, _ in self._pages.values():
+                self._patch_label(patch_list, index, label)
+
+    def clear(self):
+        # waits for reads in flight, the caller may be about to close the environment they read from
+        with self._condition:
+            self._wanted = []
+            while self._in_flight > 0:
+                self._condition.wait()
+            self._generation += 1
+            self._pages.clear()
+            self._bytes = 0
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._wanted and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                key = self._wanted.pop(0)
+                if key in self._pages:
+                    continue
+                self._loading = key
+                generation, mark = self._begin_load()
+
+            try:
+                patch_list = self._loader(*key)
+            except Exception as e:
+                print('prefetch of page {} failed: {}'.format(key, e))
+                patch_list = None
+
+            with self._condition:
+                self._loading = None
+                self._end_load(key, patch_list, generation, mark)
+                self._condition.notify_all()
+
+    def _begin_load(self):
+        self._in_flight += 1
+        return self._generation, len(self._edit_log)
+
+    def _end_load(self, key, patch_list, generation, mark):
+        # labels written while the page was being read are replayed on top of it
+        if patch_list is not None:
+            for index, label in self._edit_log[mark:]:
+                self._patch_label(patch_list, index, label)
+        self._in_flight -= 1
+        if self._in_flight == 0:
+            self._edit_log = []
+            self._condition.notify_all()
+        if patch_list is not None and generation == self._generation:
+            self._insert(key, patch_list)
+        return patch_list
+
+    def _insert(self, key, patch_list):
+        if key in self._pages:
+            self._bytes -= self._pages.pop(key)[1]
+        size = patch_list_size(patch_list)
+        self._pages[key] = (patch_list, size)
+        self._bytes += size
+        while self._bytes > self._max_bytes and len(self._pages) > 1:
+            _, (_, evicted_size) = self._pages.popitem(last=False)
+            self._bytes -= evicted_size
+
+    @staticmethod
+    def _patch_label(patch_list, index, label):
+        for i, patch in enumerate(patch_list):
+            if patch.index == index:
+                patch_list[i] = patch.with_label(label)
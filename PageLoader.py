@@ -0,0 +1,47 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class PageLoadTask(QRunnable):
+    def __init__(self, page_loader, request_id, load):
+        super().__init__()
+        self._page_loader = page_loader
+        self._request_id = request_id
+        self._load = load
+
+    def run(self):
+        # requests overtaken by a newer one before they started are dropped without reading
+        if not self._page_loader.is_current(self._request_id):
+            return
+        try:
+            patch_list = self._load()
+        except Exception as e:
+            print('page load failed: {}'.format(e))
+            patch_list = None
+        self._page_loader.page_loaded.emit(self._request_id, patch_list)
+
+
+class PageLoader(QObject):
+    page_loaded = pyqtSignal(int, object)
+    patch_list_ready = pyqtSignal(object)
+
+    def __init__(self, parent=None, thread_count=2):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(thread_count)
+        self._request_id = 0
+        self.page_loaded.connect(self._on_page_loaded)
+
+    def is_current(self, request_id):
+        return request_id == self._request_id
+
+    def request(self, load):
+        self._request_id += 1
+        self._pool.start(PageLoadTask(self, self._request_id, load))
+
+    def wait(self):
+        self._pool.waitForDone()
+
+    def _on_page_loaded(self, request_id, patch_list):
+        if request_id != self._request_id or patch_list is None:
+            return
+        self.patch_list_ready.emit(patch_list)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import re
+import shlex
+import numpy as np
+
+from LabelDataModel import label_flags
+from MetadataIndex import FLAG_MISSING, FLAG_TO_BE_DELETED, FLAG_DELETED
+
+
+def parse_range(text, cast):
+    if ':' not in text:
+        value = cast(text)
+        return value, value
+    low, high = text.split(':', 1)
+    return (cast(low) if low else None), (cast(high) if high else None)
+
+
+def parse_bool(text):
+    if text.lower() in ('1', 'yes', 'true', 'y'):
+        return True
+    if text.lower() in ('0', 'no', 'false', 'n'):
+        return False
+    raise ValueError('expected yes or no, got {}'.format(text))
+
+
+def apply_range(mask, column, value_range):
+    low, high = value_range
+    if low is not None:
+        mask &= column >= low
+    if high is not None:
+        mask &= column <= high
+    return mask
+
+
+# filter expression, space separated terms that must all match:
+#   label~REGEX   ratio=MIN:MAX   len=MIN:MAX   deleted=yes|no   ppc<PIXELS_PER_CHAR   unique=yes|no
+#   range=START:STOP (record indices, STOP excluded)
+class PatchFilter:
+    def __init__(self, expression='', label_regex=None, ratio_range=None, length_range=None, deleted=None,
+                 max_pixels_per_char=None, unique=False, index_range=None):
+        self._expression = expression
+        self._label_regex = label_regex
+        self._ratio_range = ratio_range
+        self._length_range = length_range
+        self._deleted = deleted
+        self._max_pixels_per_char = max_pixels_per_char
+        self._unique = unique
+        self._index_range = index_range
+
+    @classmethod
+    def parse(cls, expression):
+        kwargs = {}
+        for term in shlex.split(expression):
+            if term.startswith('label~'):
+                kwargs['label_regex'] = re.compile(term[len('label~'):])
+            elif term.startswith('ratio='):
+                kwargs['ratio_range'] = parse_range(term[len('ratio='):], float)
+            elif term.startswith('len='):
+                kwargs['length_range'] = parse_range(term[len('len='):], int)
+            elif term.startswith('deleted='):
+                kwargs['deleted'] = parse_bool(term[len('deleted='):])
+            elif term.startswith('ppc<'):
+                kwargs['max_pixels_per_char'] = float(term[len('ppc<'):])
+            elif term.startswith('unique='):
+                kwargs['unique'] = parse_bool(term[len('unique='):])
+            elif term.startswith('range='):
+                kwargs['index_range'] = parse_range(term[len('range='):], int)
+            else:
+                raise ValueError('unknown filter term: {}'.format(term))
+        return cls(expression, **kwargs)
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @property
+    def unique(self):
+        # one representative per near duplicate cluster, its label edits apply to the whole cluster
+        return self._unique
+
+    @property
+    def needs_metadata(self):
+        return self._ratio_range is not None or self._max_pixels_per_char is not None
+
+    def resolve(self, dataset):
+        metadata = dataset.metadata
+        if self.needs_metadata and metadata is None:
+            raise ValueError('filter needs the metadata index, build it with tool/build_metadata.py')
+        duplicates = dataset.duplicates
+        if self._unique and duplicates is None:
+            raise ValueError('unique= needs the duplicate index, build it with tool/build_duplicates.py')
+
+        if metadata is not None:
+            mask = (metadata.flags & FLAG_MISSING) == 0
+            if self._ratio_range is not None:
+                mask = apply_range(mask, metadata.aspect_ratio, self._ratio_range)
+            if self._length_range is not None:
+                mask = apply_range(mask, metadata.label_length, self._length_range)
+            if self._max_pixels_per_char is not None:
+                mask &= metadata.pixels_per_char() < self._max_pixels_per_char
+            if self._deleted is not None:
+                deleted = (metadata.flags & (FLAG_TO_BE_DELETED | FLAG_DELETED)) != 0
+                mask &= deleted if self._deleted else ~deleted
+        else:
+            mask = None
+        if self._index_range is not None:
+            low, high = self._index_range
+            if mask is None:
+                mask = np.zeros(dataset.sample_count + 1, dtype=bool)
+                mask[low:high] = True
+            else:
+                mask[:low or 0] = False
+                if high is not None:
+                    mask[high:] = False
+        if self._unique:
+            representatives = duplicates.representative_mask()
+            mask = representatives if mask is None else mask & representatives
+        if mask is not None:
+            # records start at 1, the masks have an empty slot 0 the labeler must never page onto
+            mask[:1] = False
+        label_terms = self._length_range is not None or self._deleted is not None
+        if mask is not None and self._label_regex is None and (metadata is not None or not label_terms):
+            return np.flatnonzero(mask)
+
+        # a label regex only looks at the candidates of the label index instead of scanning every label
+        if self._label_regex is not None:
+            label_index = dataset.label_index
+            labels = ((int(index), label_index.label_of(index)) for index in label_index.find_regex(self._label_regex))
+        else:
+            labels = dataset.iter_labels()
+
+        hits = []
+        for index, label in labels:
+            if mask is not None and (index >= len(mask) or not mask[index]):
+                continue
+            if not self._match_label(label):
+                continue
+            hits.append(index)
+        return np.array(hits, dtype=np.int64)
+
+    def _match_label(self, label):
+        if self._label_regex is not None and self._label_regex.search(label) is None:
+            return False
+        if self._length_range is not None:
+            low, high = self._length_range
+            if (low is not None and len(label) < low) or (high is not None and len(label) > high):
+                return False
+        if self._deleted is not None:
+            if (label_flags(label) != 0) != self._deleted:
+                return False
+        return True
@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QWidget, QGridLayout, QHBoxLayout, QScrollBar
+
+from ImagePatchLabelView import ImagePatchView, cv_image_to_qimage
+
+
+# display sized QImages keyed by index and label version, a page seen before is shown without decoding anything.
+# the label is part of the key so a record that was rewritten is not shown with a stale image. the key says nothing
+# about the lmdb, the cache is cleared whenever one is opened. pages are prepared on the page loader thread,
+# binding them on the gui thread only looks the images up
+class DisplayImageCache:
+    def __init__(self, display_size=(256, 64), max_bytes=64 * 1024 * 1024):
+        self._display_size = display_size
+        self._max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def display_size(self):
+        return self._display_size
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, patch, generation=None):
+        # (QImage, stored image size), None for a record without a readable image. an image made for a generation
+        # before the last clear is handed out but not kept
+        key = (patch.index, patch.file_path, patch.label)
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+                return entry[:2]
+
+        image = patch.display_image(*self._display_size)
+        if image is None:
+            return None
+        # the array backs the QImage and is kept with it
+        entry = (cv_image_to_qimage(image), patch.image_size, image)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry[:2]
+            self._images[key] = entry
+            self._bytes += image.nbytes
+            while self._bytes > self._max_bytes and len(self._images) > 1:
+                _, (_, _, evicted) = self._images.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return entry[:2]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._images.clear()
+            self._bytes = 0
+
+    def relabel(self, patch, label):
+        # an edited label keeps the image that is already there
+        with self._lock:
+            entry = self._images.pop((patch.index, patch.file_path, patch.label), None)
+            if entry is not None:
+                self._images[(patch.index, patch.file_path, label)] = entry
+
+
+# Shows a page of any size with only as many ImagePatchView widgets as fit on screen,
+# scrolling rebinds the same widgets to other patches of the page.
+class PatchGrid(QWidget):
+    def __init__(self, controller, column_count=1, display_size=(256, 64)):
+        super().__init__()
+        self._controller = controller
+        self._column_count = column_count
+        self._image_cache = DisplayImageCache(display_size)
+        self._patch_list = []
+        self._placeholder = None
+        self._row_height = display_size[1] + 24
+        self._visible_rows = 1
+        self._views = []
+        self._body = QWidget()
+        self._grid = QGridLayout()
+        self._scroll_bar = QScrollBar(Qt.Vertical)
+        self.init_ui()
+
+    @property
+    def views(self):
+        return self._views
+
+    def init_ui(self):
+        self._grid.setAlignment(Qt.AlignTop)
+        self._body.setLayout(self._grid)
+        layout = QHBoxLayout()
+        layout.addWidget(self._body, stretch=10)
+        layout.addWidget(self._scroll_bar)
+        self.setLayout(layout)
+        self._scroll_bar.valueChanged.connect(self._bind)
+        self._ensure_views()
+
+    @property
+    def display_size(self):
+        return self._image_cache.display_size
+
+    def clear_image_cache(self):
+        self._image_cache.clear()
+
+    def prepare_loader(self, load):
+        # wraps a page load so the display images of the page are made on the thread that reads it
+        generation = self._image_cache.generation
+
+        def load_prepared():
+            patch_list = load()
+            for patch in patch_list or []:
+                self._image_cache.get(patch, generation)
+            return patch_list
+        return load_prepared
+
+    def set_placeholder(self, text):
+        self._placeholder = text
+        for view in self._views:
+            view.set_placeholder(text)
+
+    def set_patch_list(self, patch_list):
+        self._placeholder = None
+        self._patch_list = list(patch_list)
+        self._update_scroll_range()
+        if self._scroll_bar.value() != 0:
+            self._scroll_bar.setValue(0)
+        else:
+            self._bind()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._ensure_views()
+        self._update_scroll_range()
+        self._bind()
+
+    def wheelEvent(self, event):
+        step = -1 if event.angleDelta().y() > 0 else 1
+        self._scroll_bar.setValue(self._scroll_bar.value() + step)
+
+    def _ensure_views(self):
+        self._visible_rows = max(1, self._body.height() // self._row_height)
+        needed = self._visible_rows * self._column_count
+        while len(self._views) < needed:
+            view = ImagePatchView(self._controller)
+            view.label_committed.connect(self._label_committed)
+            slot = len(self._views)
+            self._grid.addWidget(view, slot // self._column_count, slot % self._column_count, alignment=Qt.AlignTop)
+            self._views.append(view)
+        for slot, view in enumerate(self._views):
+            view.setVisible(slot < needed)
+
+    def _update_scroll_range(self):
+        total_rows = (len(self._patch_list) + self._column_count - 1) // self._column_count
+        self._scroll_bar.setRange(0, max(0, total_rows - self._visible_rows))
+        self._scroll_bar.setPageStep(self._visible_rows)
+
+    def _bind(self):
+        if self._placeholder is not None:
+            self.set_placeholder(self._placeholder)
+            return
+
+        first = self._scroll_bar.value() * self._column_count
+        for slot, view in enumerate(self._views):
+            position = first + slot
+            if not view.isVisibleTo(self) or position >= len(self._patch_list):
+                view.set_placeholder('')
+                continue
+            patch = self._patch_list[position]
+            entry = self._image_cache.get(patch)
+            if entry is None:
+                view.set(patch.index, None, patch.label, patch.file_path)
+                continue
+            image, image_size = entry
+            view.set(patch.index, None, patch.label, patch.file_path, QPixmap.fromImage(image), image_size)
+
+    def _label_committed(self, index, label):
+        for position, patch in enumerate(self._patch_list):
+            if patch.index == index:
+                self._image_cache.relabel(patch, label)
+                self._patch_list[position] = patch.with_label(label)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+LAYOUT_KEY = b'layout-version'
+
+IMAGE = 'image'
+LABEL = 'label'
+PATH = 'path'
+FIELDS = (IMAGE, LABEL, PATH)
+
+
+# where the image, label and path of a record are stored. every reader and writer goes through the layout of
+# its lmdb, found by detect_layout, so both versions can be used by every tool
+class RecordLayout:
+    version = None
+
+    def db(self, field):
+        return None
+
+    def key_function(self, field):
+        # index -> key of the field
+        raise NotImplementedError
+
+    def index_function(self, field):
+        # key read from the field's cursor -> index, None for a key that belongs to something else
+        raise NotImplementedError
+
+    def seek_first(self, cursor, field):
+        raise NotImplementedError
+
+    def cursor(self, txn, field):
+        return txn.cursor(db=self.db(field))
+
+    def get(self, txn, field, index):
+        return txn.get(self.key_function(field)(index), db=self.db(field))
+
+    def put(self, txn, field, index, value):
+        return txn.put(self.key_function(field)(index), value, db=self.db(field))
+
+
+# version 1: 'image-%09d', 'label-%09d' and 'path-%09d' keys in the main database. the three kinds sort into
+# separate regions, so one record touches three unrelated pages and a label scan passes the image region
+class PrefixedLayout(RecordLayout):
+    version = 1
+    PREFIXES = {IMAGE: b'image-', LABEL: b'label-', PATH: b'path-'}
+
+    def key_function(self, field):
+        return (self.PREFIXES[field] + b'%09d').__mod__
+
+    def index_function(self, field):
+        prefix = self.PREFIXES[field]
+        length = len(prefix)
+
+        def index_of(key):
+            # keys are buffers in a buffers=True transaction
+            key = bytes(key)
+            return int(key[length:]) if key.startswith(prefix) else None
+        return index_of
+
+    def seek_first(self, cursor, field):
+        return cursor.set_range(self.PREFIXES[field])
+
+
+# version 2: images, labels and paths in named sub-databases keyed by the 8 byte big-endian index. the label
+# and path trees hold nothing else, they stay small enough to be cache resident and a label scan reads only them
+class PackedLayout(RecordLayout):
+    version = 2
+    DB_NAMES = {IMAGE: b'images', LABEL: b'labels', PATH: b'paths'}
+
+    def __init__(self, env, txn=None):
+        # with a write transaction the sub-databases are created
+        self._dbs = {field: env.open_db(name, txn=txn, create=txn is not None) for field, name in self.DB_NAMES.items()}
+
+    def db(self, field):
+        return self._dbs[field]
+
+    def key_function(self, field):
+        return pack_index
+
+    def index_function(self, field):
+        return unpack_index
+
+    def seek_first(self, cursor, field):
+        return cursor.first()
+
+
+LAYOUTS = {PrefixedLayout.version: PrefixedLayout, PackedLayout.version: PackedLayout}
+
+
+def pack_index(index):
+    return int(index).to_bytes(8, 'big')
+
+
+def unpack_index(key):
+    return int.from_bytes(key, 'big')
+
+
+def detect_layout(env):
+    # lmdbs written before layout versions existed have no version key and use version 1
+    with env.begin() as txn:
+        version = txn.get(LAYOUT_KEY)
+    version = int(version) if version is not None else PrefixedLayout.version
+    if version not in LAYOUTS:
+        raise ValueError('unknown record layout version {}'.format(version))
+    return PrefixedLayout() if version == PrefixedLayout.version else PackedLayout(env)
+
+
+def create_layout(env, txn, version):
+    # records of a new lmdb are written in the given layout version
+    if version not in LAYOUTS:
+        raise ValueError('unknown record layout version {}'.format(version))
+    if version == PrefixedLayout.version:
+        return PrefixedLayout()
+    txn.put(LAYOUT_KEY, str(version).encode())
+    return PackedLayout(env, txn)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from itertools import islice
+
+from RecordLayout import IMAGE, LABEL, PATH
+
+# indexes are read in chunks, every cursor fills a whole chunk in one tight loop before the next cursor runs
+CHUNK_SIZE = 256
+# chunks spread wider than this many keys per index are read with lookups instead of cursor steps
+SPARSE_SPAN = 4
+
+
+class FieldCursor:
+    # reads the values of one record field for ascending indexes. a run of consecutive indexes is one set_range
+    # followed by iternext over the keys, the next index after a hit is a single step of the cursor, and only
+    # far jumps pay a b-tree descent like a get does
+    def __init__(self, txn, layout, field):
+        self._cursor = layout.cursor(txn, field)
+        self._key = layout.key_function(field)
+        self._index_of = layout.index_function(field)
+        self._items = None
+        self._index = None
+        self._value = None
+
+    def values(self, indices):
+        # one value per index, None where the lmdb has no such key
+        span = indices[-1] - indices[0] + 1
+        if span == len(indices):
+            return self._range_values(indices[0], len(indices))
+        if span > SPARSE_SPAN * len(indices):
+            # few neighbours to step to, a plain lookup per index is cheapest
+            self._items = self._index = self._value = None
+            get = self._cursor.get
+            key = self._key
+            return [get(key(index)) for index in indices]
+
+        cursor = self._cursor
+        index_of = self._index_of
+        items, current, value = self._items, self._index, self._value
+        values = []
+        for index in indices:
+            if current is not None and index == current + 1:
+                if items is None:
+                    items = cursor.iternext()
+                    next(items)
+                item = next(items, None)
+                current = index_of(item[0]) if item is not None else None
+                if current is None:
+                    items = None
+                else:
+                    value = item[1]
+            elif index != current:
+                items = None
+                value = cursor.get(self._key(index))
+                current = index if value is not None else None
+            values.append(value if current == index else None)
+        self._items, self._index, self._value = items, current, value
+        return values
+
+    def _range_values(self, start, count):
+        cursor = self._cursor
+        self._items = self._index = self._value = None
+        first_key = self._key(start)
+        if not cursor.set_range(first_key):
+            return [None] * count
+        if cursor.key() == first_key:
+            # count keys running from the first to the last index of the run can only be the run itself,
+            # so none of the keys in between has to be looked at
+            values = list(islice(cursor.iternext(keys=False), count))
+            if len(values) == count and cursor.key() == self._key(start + count - 1):
+                return values
+            cursor.set_range(first_key)
+
+        # the run has gaps, every key is placed by its index
+        values = [None] * count
+        index_of = self._index_of
+        for key, value in cursor.iternext():
+            index = index_of(key)
+            if index is None or index - start >= count:
+                break
+            values[index - start] = value
+        return values
+
+
+def scan_records(txn, layout, indices, images=True, labels=True, paths=True):
+    # (index, image bytes, label bytes, path bytes) for ascending indexes, with one cursor per field walking
+    # alongside the others instead of three gets per record. values that are missing or not asked for are None.
+    # with a buffers=True transaction the values are buffers, valid until the transaction ends
+    cursors = [FieldCursor(txn, layout, field) if wanted else None
+               for field, wanted in ((IMAGE, images), (LABEL, labels), (PATH, paths))]
+    indices = iter(indices)
+    while True:
+        chunk = list(islice(indices, CHUNK_SIZE))
+        if not chunk:
+            return
+        columns = [cursor.values(chunk) if cursor is not None else [None] * len(chunk) for cursor in cursors]
+        yield from zip(chunk, *columns)
+
+
+def iter_field(txn, layout, field):
+    # (index, value) of every record that has the field, in index order
+    cursor = layout.cursor(txn, field)
+    if not layout.seek_first(cursor, field):
+        return
+    index_of = layout.index_function(field)
+    for key, value in cursor:
+        index = index_of(key)
+        if index is None:
+            break
+        yield index, value
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+
+DEFAULT_SESSION = {'position': 1, 'filter': '', 'page_size': None}
+
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def write_atomic(path, data):
+    # a crash leaves either the old or the new file, never a partial one
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+# one bit per record, packed 8 records per byte, kept in memory and saved to a .npy file on flush.
+# not memory mapped, windows cannot replace a file that is still mapped
+class ReviewBitmap:
+    def __init__(self, path, size):
+        self._path = path
+        self._size = size
+        self._bitmap = np.zeros((size + 7) // 8, dtype=np.uint8)
+        self._dirty = False
+        if os.path.exists(path):
+            bitmap = np.load(path)
+            # the dataset grew or shrank, keep the bits that are still in range
+            count = min(len(bitmap), len(self._bitmap))
+            self._bitmap[:count] = bitmap[:count]
+            self._dirty = len(bitmap) != len(self._bitmap)
+
+    def __len__(self):
+        return self._size
+
+    def mark(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[(indices >= 0) & (indices < self._size)]
+        np.bitwise_or.at(self._bitmap, indices >> 3, (0x80 >> (indices & 7)).astype(np.uint8))
+        self._dirty = True
+
+    def mark_range(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, self._size)
+        if start >= stop:
+            return
+        first_byte = (start + 7) // 8
+        last_byte = stop // 8
+        if first_byte < last_byte:
+            self._bitmap[first_byte:last_byte] = 0xFF
+            self.mark(np.r_[start:first_byte * 8, last_byte * 8:stop])
+        else:
+            self.mark(np.arange(start, stop))
+
+    def contains(self, index):
+        return 0 <= index < self._size and bool(self._bitmap[index >> 3] & (0x80 >> (index & 7)))
+
+    def marked(self, indices):
+        # one bool per index, indexes out of range are unmarked
+        indices = np.asarray(indices, dtype=np.int64)
+        in_range = (indices >= 0) & (indices < self._size)
+        marked = np.zeros(len(indices), dtype=bool)
+        valid = indices[in_range]
+        marked[in_range] = (self._bitmap[valid >> 3] & (0x80 >> (valid & 7))) != 0
+        return marked
+
+    def count(self):
+        return int(_BYTE_POPCOUNT[self._bitmap].sum(dtype=np.int64))
+
+    def first_unmarked(self, start=0):
+        for byte in np.flatnonzero(self._bitmap[start >> 3:] != 0xFF) + (start >> 3):
+            for bit in range(8):
+                index = int(byte) * 8 + bit
+                if index >= self._size:
+                    return None
+                if index >= start and not self._bitmap[byte] & (0x80 >> bit):
+                    return index
+        return None
+
+    def flush(self):
+        if not self._dirty:
+            return
+        # cleared before the copy, a mark while saving leaves the bitmap dirty for the next flush
+        self._dirty = False
+        data = io.BytesIO()
+        np.save(data, self._bitmap.copy())
+        write_atomic(self._path, data.getvalue())
+
+
+# the position, filter and page size of every dataset opened, plus which records were viewed and verified.
+# updates are kept in memory and written atomically by a background thread debounce seconds later
+class SessionStore:
+    def __init__(self, path='.sessions', debounce=1.0, legacy_bookmark='.bookmark'):
+        self._path = path
+        self._debounce = debounce
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._dirty = set()
+        self._last_dirty = False
+        self._closed = False
+        self._worker = None
+        self._bitmaps = {}
+        os.makedirs(path, exist_ok=True)
+        self._state = self._read()
+        if self._state['last'] is None and legacy_bookmark is not None and os.path.exists(legacy_bookmark):
+            self._import_bookmark(legacy_bookmark)
+
+    def _state_path(self):
+        return os.path.join(self._path, 'sessions.json')
+
+    def _read(self):
+        try:
+            with open(self._state_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'last': None, 'datasets': {}}
+
+    def _import_bookmark(self, bookmark_path):
+        try:
+            with open(bookmark_path, 'rb') as f:
+                lmdb_path = pickle.load(f)
+                index = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if lmdb_path is not None:
+            self.update(lmdb_path, position=index)
+
+    @staticmethod
+    def key(lmdb_path):
+        return os.path.abspath(lmdb_path)
+
+    @property
+    def last_dataset(self):
+        with self._condition:
+            return self._state['last']
+
+    def get(self, lmdb_path):
+        with self._condition:
+            session = dict(DEFAULT_SESSION)
+            session.update(self._state['datasets'].get(self.key(lmdb_path), {}))
+            return session
+
+    def update(self, lmdb_path, **fields):
+        key = self.key(lmdb_path)
+        with self._condition:
+            session = self._state['datasets'].setdefault(key, {})
+            session.update(fields)
+            session['updated'] = time.time()
+            self._state['last'] = key
+            self._dirty.add(key)
+            self._last_dirty = True
+            if self._debounce > 0 and self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name='session-store', daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+        if self._debounce <= 0:
+            self.flush()
+
+    def _bitmap(self, lmdb_path, kind, size):
+        name = '{}.{}.npy'.format(hashlib.sha1(self.key(lmdb_path).encode('utf-8')).hexdigest()[:16], kind)
+        bitmap = self._bitmaps.get(name)
+        if bitmap is None or len(bitmap) != size:
+            if bitmap is not None:
+                with self._flush_lock:
+                    bitmap.flush()
+            bitmap = ReviewBitmap(os.path.join(self._path, name), size)
+            self._bitmaps[name] = bitmap
+        return bitmap
+
+    def viewed(self, lmdb_path, size):
+        return self._bitmap(lmdb_path, 'viewed', size)
+
+    def verified(self, lmdb_path, size):
+        return self._bitmap(lmdb_path, 'verified', size)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                dirty = self._dirty
+                last_dirty = self._last_dirty
+                self._dirty = set()
+                self._last_dirty = False
+                sessions = {key: dict(self._state['datasets'][key]) for key in dirty}
+                last = self._state['last']
+            for bitmap in list(self._bitmaps.values()):
+                bitmap.flush()
+            if not dirty and not last_dirty:
+                return
+
+            # merge into what is on disk, another labeler window may have saved its datasets meanwhile
+            state = self._read()
+            state['datasets'].update(sessions)
+            if last_dirty:
+                state['last'] = last
+            write_atomic(self._state_path(), json.dumps(state, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self._debounce
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self.flush()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.flush()
@@ -1,3 +1,4 @@
+import re
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QLabel, QApplication, QFileDialog, QLineEdit, QMessageBox
 from PyQt5.QtCore import Qt
 from Controller import Controller
@@ -8,11 +9,29 @@ class TopButtonGroup(QWidget):
         super().__init__()
         self._position_text = QLineEdit(self)
         self._position_label = QLabel()
+        self._filter_text = QLineEdit(self)
+        self._filter_text.setPlaceholderText('filter: label~REGEX ratio=MIN:MAX len=MIN:MAX deleted=no ppc<5 '
+                                             'unique=yes range=START:STOP')
+        self._search_text = QLineEdit(self)
+        self._search_text.setPlaceholderText('find: text  prefix*  =exact  /regex')
         self._open_button = QPushButton('Open')
         self._next_button = QPushButton('Next')
         self._next_button.setShortcut("Ctrl+n")
         self._prev_button = QPushButton('Prev')
         self._prev_button.setShortcut("Ctrl+p")
+        # ctrl+z alone stays with the label line edits
+        self._undo_button = QPushButton('Undo')
+        self._undo_button.setShortcut("Ctrl+Alt+z")
+        self._redo_button = QPushButton('Redo')
+        self._redo_button.setShortcut("Ctrl+Alt+y")
+        # pages to the next patch with too few pixels per character, shift goes back
+        self._suspicious_button = QPushButton('Suspicious')
+        self._suspicious_button.setShortcut("Ctrl+Alt+s")
+        # pages to the first record from here on that no page turn confirmed yet
+        self._unreviewed_button = QPushButton('Unreviewed')
+        self._unreviewed_button.setShortcut("Ctrl+Alt+u")
+        # leases the next range of a lmdb shared by several labelers
+        self._claim_button = QPushButton('Claim')
         self._controller = controller
 
         self._current_path = None
@@ -24,15 +43,29 @@ class TopButtonGroup(QWidget):
         layout.addWidget(self._position_label)
         self._position_text.setMaximumSize(100, 64)
         layout.addWidget(self._position_text)
+        layout.addWidget(self._filter_text)
+        layout.addWidget(self._search_text)
         layout.addWidget(self._open_button)
         layout.addWidget(self._prev_button)
         layout.addWidget(self._next_button)
+        layout.addWidget(self._undo_button)
+        layout.addWidget(self._redo_button)
+        layout.addWidget(self._suspicious_button)
+        layout.addWidget(self._unreviewed_button)
+        layout.addWidget(self._claim_button)
         self.setLayout(layout)
 
         self._position_text.editingFinished.connect(self.change_page)
+        self._filter_text.editingFinished.connect(self.change_filter)
+        self._search_text.returnPressed.connect(self.find_label)
         self._open_button.clicked.connect(self.open_image)
         self._next_button.clicked.connect(self.next_image)
         self._prev_button.clicked.connect(self.prev_image)
+        self._undo_button.clicked.connect(self.undo)
+        self._redo_button.clicked.connect(self.redo)
+        self._suspicious_button.clicked.connect(self.next_suspicious)
+        self._unreviewed_button.clicked.connect(self.next_unreviewed)
+        self._claim_button.clicked.connect(self.claim_range)
 
     def change_page(self):
         text = self._position_text.text()
@@ -45,32 +78,89 @@ class TopButtonGroup(QWidget):
             QMessageBox.warning(self, 'warning', 'invalid data index, input only integer number!', QMessageBox.Ok)
             return
 
-        QApplication.setOverrideCursor(Qt.WaitCursor)
         self._controller.go(index)
-        QApplication.restoreOverrideCursor()
         self._position_label.setText(self._controller.get_status_text())
 
+    def change_filter(self):
+        error = None
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            result = self._controller.set_filter(self._filter_text.text().strip())
+        except (ValueError, re.error) as e:
+            result = None
+            error = e
+        finally:
+            # the wait cursor is popped exactly once, an outer override cursor stays
+            QApplication.restoreOverrideCursor()
+        if error is not None:
+            QMessageBox.warning(self, 'warning', 'invalid filter: {}'.format(error), QMessageBox.Ok)
+        if result is None:
+            self._filter_text.setText('')
+        self._position_label.setText(self._controller.get_status_text())
+
+    def find_label(self):
+        query = self._search_text.text()
+        if query == '':
+            return
+        # shift+enter searches backwards
+        backward = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        try:
+            result = self._controller.find(query, backward)
+        except re.error as e:
+            QMessageBox.warning(self, 'warning', 'invalid regex: {}'.format(e), QMessageBox.Ok)
+            return
+        if result is None:
+            QMessageBox.information(self, 'find', 'no label matches {}'.format(query), QMessageBox.Ok)
+            return
+        _, position, count = result
+        self._position_label.setText('{} (hit {}/{})'.format(self._controller.get_status_text(), position + 1,
+                                                             count))
 
     def open_image(self):
         open_file_info = QFileDialog.getExistingDirectory(self, 'select lmdb database folder', './',
                                                           options=QFileDialog.ShowDirsOnly)
         if open_file_info is not None and open_file_info != "":
             self._current_path = open_file_info
-            self._controller.open_lmdb(self._current_path, 1)
+            self._controller.open_lmdb(self._current_path)
         self._position_label.setText(self._controller.get_status_text())
         QApplication.restoreOverrideCursor()
 
     def next_image(self):
-        QApplication.setOverrideCursor(Qt.WaitCursor)
         self._controller.next_patch()
         self._position_label.setText(self._controller.get_status_text())
-        QApplication.restoreOverrideCursor()
 
     def prev_image(self):
-        QApplication.setOverrideCursor(Qt.WaitCursor)
         self._controller.prev_patch()
         self._position_label.setText(self._controller.get_status_text())
-        QApplication.restoreOverrideCursor()
+
+    def undo(self):
+        self._controller.undo()
+        self._position_label.setText(self._controller.get_status_text())
+
+    def redo(self):
+        self._controller.redo()
+        self._position_label.setText(self._controller.get_status_text())
+
+    def next_suspicious(self):
+        backward = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        if self._controller.next_suspicious_patch(backward=backward) is None:
+            QMessageBox.information(self, 'suspicious', 'no suspicious patch {} (build the metadata index with '
+                                    'tool/build_metadata.py)'.format('before' if backward else 'after'),
+                                    QMessageBox.Ok)
+        self._position_label.setText(self._controller.get_status_text())
+
+    def next_unreviewed(self):
+        if self._controller.next_unreviewed_patch() is None:
+            QMessageBox.information(self, 'unreviewed', 'every record is reviewed', QMessageBox.Ok)
+        self._position_label.setText(self._controller.get_status_text())
+
+    def claim_range(self):
+        lease = self._controller.claim_range()
+        if lease is None:
+            QMessageBox.information(self, 'claim', 'no range left to label', QMessageBox.Ok)
+        else:
+            self._filter_text.setText('range={}:{}'.format(lease.start, lease.stop))
+        self._position_label.setText(self._controller.get_status_text())
 
     def update(self):
         self._position_label.setText(self._controller.get_status_text())
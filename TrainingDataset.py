@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+
+from LabelDataModel import TextRecognitionImagePatchDataset, label_flags
+from LmdbConfig import READER, open_environment
+from MetadataIndex import MetadataIndex, metadata_path
+from RecordLayout import IMAGE, LABEL, detect_layout
+from RecordScan import scan_records, iter_field
+
+try:
+    from torch.utils.data import Dataset, IterableDataset, get_worker_info
+except ImportError:
+    Dataset = object
+    IterableDataset = object
+
+    def get_worker_info():
+        return None
+
+
+_environments = {}
+
+
+def shared_environment(lmdb_path):
+    # lmdb allows one environment per path and process, readers of the same folder share it.
+    # a forked worker inherits the parent's handle, which must be dropped before the path can be opened again
+    path = os.path.abspath(lmdb_path)
+    pid = os.getpid()
+    for key in [key for key in _environments if key[0] == path and key[1] != pid]:
+        _environments.pop(key).close()
+    if (path, pid) not in _environments:
+        _environments[(path, pid)] = open_environment(lmdb_path, READER)
+    return _environments[(path, pid)]
+
+
+class LmdbPatchReader:
+    def __init__(self, lmdb_path, w_size=128, h_size=32, interpolation=cv2.INTER_CUBIC, resize_workers=1):
+        self._lmdb_path = lmdb_path
+        self._w_size = w_size
+        self._h_size = h_size
+        self._interpolation = interpolation
+        self._resize_workers = resize_workers
+        self._resizer = None
+        self._lmdb = None
+        self._layout = None
+        self._txn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # environments and transactions do not survive pickling or fork, workers reopen them lazily
+        state = self.__dict__.copy()
+        state['_resizer'] = None
+        state['_lmdb'] = None
+        state['_layout'] = None
+        state['_txn'] = None
+        state['_pid'] = None
+        return state
+
+    def txn(self):
+        if self._pid != os.getpid():
+            self._lmdb = shared_environment(self._lmdb_path)
+            self._layout = detect_layout(self._lmdb)
+            self._txn = self._lmdb.begin(write=False, buffers=True)
+            self._pid = os.getpid()
+        return self._txn
+
+    def renew(self):
+        # a fresh snapshot, picks up labels written by the labeler since the transaction started
+        if self._txn is not None and self._pid == os.getpid():
+            self._txn.abort()
+            self._txn = self._lmdb.begin(write=False, buffers=True)
+
+    def valid_indices(self):
+        # indexes of records that have an image and a label that is not a deleted marker
+        txn = self.txn()
+        n_samples = int(bytes(txn.get(b'num-samples')))
+        metadata = MetadataIndex.open(metadata_path(self._lmdb_path))
+        if metadata is not None and len(metadata) == n_samples + 1:
+            return np.flatnonzero(metadata.valid_mask())
+
+        indices = [index for index, value in iter_field(txn, self._layout, LABEL)
+                   if label_flags(bytes(value).decode('utf-8')) == 0]
+        return np.array(indices, dtype=np.int64)
+
+    def read(self, index):
+        txn = self.txn()
+        image = cv2.imdecode(np.frombuffer(self._layout.get(txn, IMAGE, index), np.uint8), cv2.IMREAD_COLOR)
+        label = bytes(self._layout.get(txn, LABEL, index)).decode('utf-8')
+        return image, label
+
+    def read_batch(self, indices):
+        # read in key order by the scan cursors, returned in the order asked for
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        images = [None] * len(indices)
+        labels = [None] * len(indices)
+        records = scan_records(self.txn(), self._layout, indices[order].tolist(), paths=False)
+        for position, (_, image_bytes, label, _) in zip(order.tolist(), records):
+            images[position] = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            labels[position] = bytes(label).decode('utf-8')
+        if self._resizer is None:
+            self._resizer = TextRecognitionImagePatchDataset(w_size=self._w_size, h_size=self._h_size,
+                                                             interpolation=self._interpolation, prefetch_depth=0)
+        return self._resizer.resize_images(images, workers=self._resize_workers), labels
+
+
+class PatchMapDataset(Dataset):
+    def __init__(self, lmdb_path, w_size=128, h_size=32, interpolation=cv2.INTER_CUBIC, indices=None):
+        self._reader = LmdbPatchReader(lmdb_path, w_size, h_size, interpolation)
+        self._indices = self._reader.valid_indices() if indices is None else indices
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, item):
+        images, labels = self._reader.read_batch([self._indices[item]])
+        return images[0], labels[0]
+
+
+class PatchBatchIterator(IterableDataset):
+    def __init__(self, lmdb_path, batch_size=64, w_size=128, h_size=32, interpolation=cv2.INTER_CUBIC,
+                 rank=0, world_size=1, shuffle=False, seed=0, drop_last=False, indices=None):
+        self._reader = LmdbPatchReader(lmdb_path, w_size, h_size, interpolation)
+        self._indices = self._reader.valid_indices() if indices is None else indices
+        self._batch_size = batch_size
+        self._rank = rank
+        self._world_size = world_size
+        self._shuffle = shuffle
+        self._seed = seed
+        self._drop_last = drop_last
+        self._epoch = 0
+
+    def set_epoch(self, epoch):
+        self._epoch = epoch
+
+    def shard(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        indices = self._indices
+        if self._shuffle:
+            indices = np.random.default_rng(self._seed + self._epoch).permutation(indices)
+        shard_count = self._world_size * num_workers
+        return indices[self._rank * num_workers + worker_id::shard_count]
+
+    def __iter__(self):
+        self._reader.renew()
+        indices = self.shard()
+        for start in range(0, len(indices), self._batch_size):
+            batch = indices[start:start + self._batch_size]
+            if self._drop_last and len(batch) < self._batch_size:
+                break
+            images, labels = self._reader.read_batch(batch)
+            yield images, labels, batch
@@ -1,30 +1,36 @@
+import argparse
 import sys
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import QMessageBox
 
-from ImagePatchLabelView import ImagePatchView
+from PatchGrid import PatchGrid
 from TopButtonGroup import TopButtonGroup
+from PageLoader import PageLoader
 
 from Controller import Controller
 
 
 class LabelWindow(QWidget):
-    def __init__(self, image_patch_count=6):
+    def __init__(self, image_patch_count=None, column_count=1):
         super(QWidget, self).__init__()
         self._controller = Controller(self)
+        self._page_loader = PageLoader(self)
+        self._page_loader.patch_list_ready.connect(self.update_image_patch)
         self._top_button_group = TopButtonGroup(self._controller)
-        self._image_patch_count = image_patch_count
-        self._image_patch_view_list = [ImagePatchView(self._controller) for _ in range(0, image_patch_count)]
+        # without --patches the page size of the last session is kept
+        self._image_patch_count = image_patch_count or self._controller.stored_page_size() or 6
+        self._patch_grid = PatchGrid(self._controller, column_count)
+        self._controller.set_display_size(self._patch_grid.display_size)
         self.init_ui()
-        self._controller.load_bookmark()
+        self._controller.load_session()
 
     @property
     def image_patch_count(self):
         return self._image_patch_count
 
     def is_updated(self):
-        for view in self._image_patch_view_list:
+        for view in self._patch_grid.views:
             if view.is_updated():
                 return True
         return False
@@ -37,26 +43,34 @@ class LabelWindow(QWidget):
         self.setMinimumHeight(1280)
 
         main_layout = QVBoxLayout()
-        body_layout = QGridLayout()
         main_layout.addWidget(self._top_button_group, alignment=Qt.AlignTop)
-        main_layout.addLayout(body_layout, stretch=10)
-
-        for i in range(0, self._image_patch_count):
-            # row = int(i / 3)
-            row = i
-            # column = i % 3
-            column = 1
-            body_layout.addWidget(self._image_patch_view_list[i], row, column, alignment=Qt.AlignTop)
+        main_layout.addWidget(self._patch_grid, stretch=10)
         self.setLayout(main_layout)
 
+    def closeEvent(self, event):
+        self._page_loader.wait()
+        self._controller.close()
+        super().closeEvent(event)
+
+    def load_image_patch(self, load):
+        self._patch_grid.set_placeholder('loading...')
+        self._page_loader.request(self._patch_grid.prepare_loader(load))
+
+    def dataset_opened(self):
+        # images cached for the previous lmdb may be keyed like records of this one
+        self._patch_grid.clear_image_cache()
+
     def update_image_patch(self, patch_list):
-        for index, patch in enumerate(patch_list):
-            self._image_patch_view_list[index].set(patch.index, patch.image, patch.label, patch.file_path)
+        self._patch_grid.set_patch_list(patch_list)
         self._top_button_group.update()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    form = LabelWindow()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patches', type=int, default=None, help='patches per page (default: as last time, or 6)')
+    parser.add_argument('--columns', type=int, default=1, help='patch columns on screen')
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    form = LabelWindow(args.patches, args.columns)
     form.show()
     app.exec_()
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LmdbConfig import READER, open_environment
+from RecordLayout import IMAGE, LABEL, PackedLayout, detect_layout
+from tool.import_lmdb import run
+
+
+def write_images(directory, count):
+    items = []
+    for number in range(count):
+        path = os.path.join(str(directory), 'w{:02d}.png'.format(number))
+        cv2.imwrite(path, np.full((16, 48, 3), number, dtype=np.uint8))
+        items.append((path, 'label {}'.format(number)))
+    return items
+
+
+def test_resume_layout_2(tmp_path):
+    items = write_images(tmp_path, 12)
+    output = str(tmp_path / 'lmdb')
+    # the first run stops after part of the input, like an interrupted import
+    assert run(items[:5], output, workers=1, chunk_size=2, layout_version=2, report_interval=1e9) == 5
+    assert run(items, output, workers=1, chunk_size=2, layout_version=2, report_interval=1e9) == 12
+
+    env = open_environment(output, READER)
+    layout = detect_layout(env)
+    assert layout.version == PackedLayout.version
+    with env.begin() as txn:
+        labels = [layout.get(txn, LABEL, index).decode() for index in range(1, 13)]
+        assert layout.get(txn, IMAGE, 12) is not None
+        assert layout.get(txn, IMAGE, 13) is None
+    env.close()
+    assert labels == ['label {}'.format(number) for number in range(12)]
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelJournal import LabelJournal
+
+
+class RecordingWriter:
+    def __init__(self, fail=0, block=None):
+        self.batches = []
+        self.entered = threading.Event()
+        self._fail = fail
+        self._block = block
+
+    def __call__(self, labels):
+        self.entered.set()
+        if self._block is not None:
+            self._block.wait()
+        if self._fail > 0:
+            self._fail -= 1
+            raise OSError('write failed')
+        self.batches.append(dict(labels))
+
+
+def test_edits_are_merged_into_one_batch():
+    writer = RecordingWriter()
+    journal = LabelJournal(writer, flush_interval=60.0)
+    journal.put(1, 'a')
+    journal.put(2, 'b')
+    journal.put(1, 'c')
+    assert journal.pending_count == 2
+    assert writer.batches == []
+    journal.flush(wait=True)
+    assert writer.batches == [{1: 'c', 2: 'b'}]
+    assert journal.pending_count == 0
+    journal.close()
+    assert writer.batches == [{1: 'c', 2: 'b'}]
+
+
+def test_get_reads_through_pending_and_flushing_edits():
+    block = threading.Event()
+    writer = RecordingWriter(block=block)
+    journal = LabelJournal(writer, flush_interval=60.0)
+    journal.put(1, 'a')
+    assert journal.get(1, 'stored') == 'a'
+    assert journal.get(2, 'stored') == 'stored'
+
+    # while the batch is being written its labels are still read from the journal
+    flushing = threading.Thread(target=journal.flush, kwargs={'wait': True})
+    flushing.start()
+    assert writer.entered.wait(5)
+    assert journal.get(1, 'stored') == 'a'
+    journal.put(1, 'newer')
+    assert journal.get(1, 'stored') == 'newer'
+    block.set()
+    flushing.join()
+    journal.close()
+    assert writer.batches == [{1: 'a'}, {1: 'newer'}]
+
+
+def test_background_flush_after_interval():
+    writer = RecordingWriter()
+    journal = LabelJournal(writer, flush_interval=0.05)
+    journal.put_many({1: 'a', 2: 'b'})
+    journal.flush()
+    journal.close()
+    assert writer.batches == [{1: 'a', 2: 'b'}]
+
+
+def test_failed_write_keeps_the_edits():
+    writer = RecordingWriter(fail=1)
+    journal = LabelJournal(writer, flush_interval=0)
+    journal.put(1, 'a')
+    assert writer.batches == []
+    assert journal.get(1) == 'a'
+    # an edit made after the failure wins over the one that failed
+    journal.put_many({1: 'b', 2: 'c'})
+    journal.close()
+    assert writer.batches == [{1: 'b', 2: 'c'}]
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import lmdb
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import (TextRecognitionImagePatchDataset, diff_label_streams, merge_resolution, KEEP_MINE,
+                            TAKE_THEIRS, CONFLICT)
+from RecordLayout import IMAGE, LABEL, create_layout
+
+
+def write_lmdb(path, labels, version=1):
+    # labels: index -> label, records without a label have only an image
+    env = lmdb.open(str(path), map_size=1 << 26, max_dbs=8)
+    with env.begin(write=True) as txn:
+        layout = create_layout(env, txn, version)
+        for index in range(1, max(labels) + 1):
+            layout.put(txn, IMAGE, index, b'image')
+            if index in labels:
+                layout.put(txn, LABEL, index, labels[index].encode())
+        txn.put(b'num-samples', str(max(labels)).encode())
+    env.close()
+    return str(path)
+
+
+def test_diff_label_streams():
+    mine = [(1, 'a'), (2, 'b'), (4, 'd'), (6, 'f')]
+    theirs = [(1, 'a'), (2, 'x'), (3, 'c'), (6, 'f'), (7, 'g')]
+    assert list(diff_label_streams(iter(mine), iter(theirs))) == [
+        (2, 'b', 'x'), (3, None, 'c'), (4, 'd', None), (7, None, 'g')]
+    assert list(diff_label_streams(iter([]), iter([]))) == []
+    assert list(diff_label_streams(iter(mine), iter([]))) == [(index, label, None) for index, label in mine]
+
+
+@pytest.mark.parametrize('mine, theirs, base, resolution', [
+    ('base', 'new', 'base', TAKE_THEIRS),
+    ('new', 'base', 'base', KEEP_MINE),
+    ('one', 'two', 'base', CONFLICT),
+    ('one', 'two', None, CONFLICT),
+    (None, 'two', 'base', CONFLICT),
+    ('one', None, 'base', CONFLICT),
+])
+def test_merge_resolution(mine, theirs, base, resolution):
+    assert merge_resolution(mine, theirs, base) == resolution
+
+
+@pytest.mark.parametrize('prefer', [KEEP_MINE, TAKE_THEIRS])
+@pytest.mark.parametrize('their_version', [1, 2])
+def test_merge_labels_with_base(tmp_path, prefer, their_version):
+    base = {1: 'a', 2: 'b', 3: 'c', 4: 'd', 5: 'e'}
+    base_path = write_lmdb(tmp_path / 'base', base)
+    mine_path = write_lmdb(tmp_path / 'mine', {**base, 2: 'mine', 4: 'both mine'})
+    theirs_path = write_lmdb(tmp_path / 'theirs', {**base, 3: 'theirs', 4: 'both theirs'}, their_version)
+
+    dataset = TextRecognitionImagePatchDataset(mine_path, prefetch_depth=0)
+    diff = [(index, resolution) for index, _, _, _, resolution in dataset.diff_labels(theirs_path, base_path)]
+    assert diff == [(2, KEEP_MINE), (3, TAKE_THEIRS), (4, CONFLICT)]
+
+    merged, conflicts = dataset.merge_labels(theirs_path, base_path, prefer)
+    assert conflicts == [(4, 'both mine', 'both theirs', 'd')]
+    assert merged == (2 if prefer == TAKE_THEIRS else 1)
+    expected = {1: 'a', 2: 'mine', 3: 'theirs', 4: 'both theirs' if prefer == TAKE_THEIRS else 'both mine', 5: 'e'}
+    assert {index: dataset.get_label(index) for index in expected} == expected
+
+    # the merge is one undo step
+    dataset.undo()
+    assert {index: dataset.get_label(index) for index in expected} == {**base, 2: 'mine', 4: 'both mine'}
+    dataset.close()
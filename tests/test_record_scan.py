@@ -0,0 +1,81 @@
+import os
+import sys
+
+import lmdb
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from RecordLayout import FIELDS, IMAGE, LABEL, PATH, LAYOUTS, create_layout, detect_layout
+from RecordScan import CHUNK_SIZE, scan_records, iter_field
+
+
+def build_lmdb(path, version, count=2000, seed=0):
+    # records 1..count with gaps, some records without a path and some with only an image
+    rng = np.random.default_rng(seed)
+    present = np.flatnonzero(rng.random(count + 1) > 0.1)
+    present = present[present > 0]
+    env = lmdb.open(str(path), map_size=1 << 28, max_dbs=8)
+    with env.begin(write=True) as txn:
+        layout = create_layout(env, txn, version)
+        for index in present.tolist():
+            layout.put(txn, IMAGE, index, b'image %d' % index)
+            if index % 7:
+                layout.put(txn, LABEL, index, b'label %d' % index)
+            if index % 5:
+                layout.put(txn, PATH, index, b'path %d' % index)
+        # meta keys sort between the record keys of layout 1
+        txn.put(b'num-samples', str(count).encode())
+        txn.put(b'import-next-item', str(count).encode())
+    env.close()
+    return count
+
+
+def workloads(count, seed=1):
+    rng = np.random.default_rng(seed)
+    return [range(1, count + 1),
+            range(0, count + 10),
+            range(1, count + 1, 3),
+            range(1, count + 1, 50),
+            sorted(rng.choice(count + 20, size=count // 4, replace=False).tolist()),
+            list(range(100, 100 + CHUNK_SIZE)) + list(range(900, 905)),
+            [5],
+            []]
+
+
+def point_gets(txn, layout, indices):
+    return [(index,) + tuple(layout.get(txn, field, index) for field in FIELDS) for index in indices]
+
+
+def as_bytes(records):
+    return [tuple(value if value is None or isinstance(value, int) else bytes(value) for value in record)
+            for record in records]
+
+
+@pytest.mark.parametrize('version', sorted(LAYOUTS))
+@pytest.mark.parametrize('buffers', [False, True])
+def test_scan_matches_point_gets(tmp_path, version, buffers):
+    count = build_lmdb(tmp_path / 'lmdb', version)
+    env = lmdb.open(str(tmp_path / 'lmdb'), readonly=True, max_dbs=8)
+    layout = detect_layout(env)
+    assert layout.version == version
+    with env.begin(buffers=buffers) as txn:
+        for indices in workloads(count):
+            assert as_bytes(scan_records(txn, layout, indices)) == as_bytes(point_gets(txn, layout, indices))
+            # fields that are not asked for are None
+            scanned = as_bytes(scan_records(txn, layout, indices, images=False, paths=False))
+            assert scanned == [(index, None, label, None) for index, _, label, _ in point_gets(txn, layout, indices)]
+    env.close()
+
+
+@pytest.mark.parametrize('version', sorted(LAYOUTS))
+def test_iter_field_matches_point_gets(tmp_path, version):
+    count = build_lmdb(tmp_path / 'lmdb', version)
+    env = lmdb.open(str(tmp_path / 'lmdb'), readonly=True, max_dbs=8)
+    layout = detect_layout(env)
+    with env.begin() as txn:
+        for field in FIELDS:
+            expected = [(index, value) for index, value in
+                        ((index, layout.get(txn, field, index)) for index in range(count + 1)) if value is not None]
+            assert list(iter_field(txn, layout, field)) == expected
+    env.close()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import TextRecognitionImagePatchDataset
+from TrainingDataset import PatchBatchIterator
+
+
+def bench_patch_list(lmdb_path, batch_size, limit):
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=0)
+    end = min(dataset.patch_count, limit)
+    t0 = time.time()
+    count = 0
+    for start in range(1, end, batch_size):
+        patch_list = dataset.get_patch_list(min(batch_size, end - start), start)
+        dataset.resize_images([patch.image for patch in patch_list if patch.image is not None])
+        count += len(patch_list)
+    elapsed = time.time() - t0
+    dataset.close()
+    return count, elapsed
+
+
+def bench_iterator(lmdb_path, batch_size, limit):
+    iterator = PatchBatchIterator(lmdb_path, batch_size)
+    t0 = time.time()
+    count = 0
+    for images, labels, indices in iterator:
+        count += len(labels)
+        if count >= limit:
+            break
+    return count, time.time() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='compare samples/sec of get_patch_list and PatchBatchIterator')
+    parser.add_argument('lmdb', help='lmdb folder')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--limit', type=int, default=100000, help='samples to read per method')
+    args = parser.parse_args(argv)
+
+    for name, bench in [('get_patch_list', bench_patch_list), ('PatchBatchIterator', bench_iterator)]:
+        count, elapsed = bench(args.lmdb, args.batch_size, args.limit)
+        print('{0:20s} {1} samples {2:.1f}s {3:.1f} samples/s'.format(name, count, elapsed, count / max(elapsed, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import lmdb_get_int
+from LmdbConfig import READER, open_environment
+from RecordLayout import IMAGE, LABEL, PATH, detect_layout
+from RecordScan import scan_records
+
+
+def point_get_records(txn, layout, indices):
+    # the per key lookups the scan replaces: three formatted keys and three b-tree descents per record
+    for index in indices:
+        yield index, layout.get(txn, IMAGE, index), layout.get(txn, LABEL, index), layout.get(txn, PATH, index)
+
+
+def bench(env, layout, read, indices):
+    t0 = time.time()
+    count = 0
+    value_bytes = 0
+    with env.begin(write=False, buffers=True) as txn:
+        for _, image_bytes, label, path in read(txn, layout, indices):
+            count += 1
+            value_bytes += len(image_bytes) if image_bytes is not None else 0
+    return count, value_bytes, time.time() - t0
+
+
+def workloads(n_samples, limit, stride, seed):
+    end = min(n_samples, limit) + 1
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(np.arange(1, n_samples + 1), size=min(limit, n_samples) // stride, replace=False))
+    return [('range', range(1, end)),
+            ('every {}th'.format(stride), range(1, min(n_samples, limit * stride) + 1, stride)),
+            ('random sorted', sample.tolist())]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='compare reading records by point gets with the cursor scan')
+    parser.add_argument('lmdb', help='lmdb folder')
+    parser.add_argument('--limit', type=int, default=200000, help='records per workload')
+    parser.add_argument('--stride', type=int, default=10, help='step of the sparse workload, like a filter result')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    env = open_environment(args.lmdb, READER)
+    layout = detect_layout(env)
+    print('record layout version {}'.format(layout.version))
+    with env.begin(write=False) as txn:
+        n_samples = lmdb_get_int(txn, 'num-samples')
+    for name, indices in workloads(n_samples, args.limit, args.stride, args.seed):
+        results = {}
+        for method, read in [('point get', point_get_records), ('scan', scan_records)]:
+            count, value_bytes, elapsed = bench(env, layout, read, indices)
+            results[method] = (count, value_bytes)
+            print('{0:15s} {1:10s} {2} records {3:.2f}s {4:.0f} records/s'.format(
+                name, method, count, elapsed, count / max(elapsed, 1e-9)))
+        if results['point get'] != results['scan']:
+            print('{}: scan and point get read different data {}'.format(name, results))
+    env.close()
+
+
+if __name__ == "__main__":
+    main()
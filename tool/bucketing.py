@@ -0,0 +1,298 @@
+"""
+width	height		width/height
+182     22	        8.00
+128	    32	        4.00
+90	    46	        2.00
+74	    56	        1.33
+64	    64	        1.00
+56	    74	        0.75
+46	    90	        0.50
+32	    128	        0.25
+22	    182	        0.13
+16      256         0.06
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+import cv2
+import lmdb
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import get_image_size, get_record_key, lmdb_get_int, lmdb_get_txt, lmdb_put_int, lmdb_put_text
+from LmdbConfig import READER, BULK_WRITER, grow_map, open_environment
+from RecordLayout import IMAGE, detect_layout
+from RecordScan import scan_records
+from tool.ordered_pool import ordered_imap
+from tool.progress import ProgressReport
+
+ratio_range = np.array([8.0, 4.0, 2.00, 1.33, 1.00, 0.75, 0.50, 0.25, 0.13, 0.06])
+# resize_array = [(182, 22), (128, 32), (90, 46), (74, 56), (64, 64),
+#                 (56, 74), (46, 90), (32, 128), (22, 182), (16, 256)]
+
+resize_array = [(364, 44), (256, 64), (180, 92), (148, 112), (128, 128),
+                (112, 148), (92, 180), (64, 256), (44, 364), (32, 512)]
+
+GARBAGE_SLOT = -1
+
+_source = None
+_layout = None
+_min_pixels_per_char = 0
+_resize = True
+
+
+def bucket_name(resize):
+    return 'lmdb' + str(resize).replace(' ', '_')
+
+
+def select_slot(width, height, label, min_pixels_per_char=0):
+    if min_pixels_per_char > 0 and (not label or width / len(label) < min_pixels_per_char):
+        return GARBAGE_SLOT
+    return int(np.argmin(np.abs(ratio_range - width / height)))
+
+
+def _init_worker(source_path, min_pixels_per_char, resize):
+    global _source, _layout, _min_pixels_per_char, _resize
+    _source = open_environment(source_path, READER, sequential=True)
+    _layout = detect_layout(_source)
+    _min_pixels_per_char = min_pixels_per_char
+    _resize = resize
+
+
+def bucket_range(index_range):
+    # image bytes are None when the record is copied unchanged, the writer then takes
+    # them from its own source transaction instead of shipping them between processes
+    start, end = index_range
+    records = []
+    with _source.begin(write=False, buffers=True) as txn:
+        for index, image_bytes, label, _ in scan_records(txn, _layout, range(start, end), paths=False):
+            if image_bytes is None or label is None:
+                continue
+            label = bytes(label).decode('utf-8')
+
+            im = None
+            size = get_image_size(image_bytes)
+            if size is None:
+                im = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+                if im is None:
+                    continue
+                size = im.shape[1], im.shape[0]
+            width, height = size
+            slot = select_slot(width, height, label, _min_pixels_per_char)
+            if not _resize or slot == GARBAGE_SLOT or size == resize_array[slot]:
+                records.append((index, slot, None, label))
+                continue
+
+            if im is None:
+                im = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+                if im is None:
+                    continue
+            im = cv2.resize(im, resize_array[slot], interpolation=cv2.INTER_CUBIC)
+            is_success, buffer = cv2.imencode('.jpg', im)
+            if not is_success:
+                print('convert image {} to byte buffer failed'.format(index))
+                continue
+            records.append((index, slot, buffer.tobytes(), label))
+    return records
+
+
+class BucketWriter:
+    def __init__(self, name, path, map_size):
+        self._name = name
+        self._path = path
+        self._lmdb = open_environment(path, BULK_WRITER, map_size=map_size, create=True)
+        self._count = 0
+        self._pending = []
+        self._txn = self._lmdb.begin(write=True)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def count(self):
+        return self._count
+
+    def read_checkpoint(self):
+        last_index = lmdb_get_int(self._txn, 'checkpoint-last-index')
+        counters = lmdb_get_txt(self._txn, 'checkpoint-counters')
+        if last_index is None or counters is None:
+            return None
+        counters = dict(item.rsplit('=', 1) for item in counters.split(';') if item)
+        return last_index, {name: int(count) for name, count in counters.items()}
+
+    def rewind(self, count):
+        # records past count were written after the checkpoint we resume from and get overwritten
+        self._count = count
+
+    def put(self, image_bytes, label, path=None):
+        # records are kept until their batch committed, a full map aborts the transaction and loses all of them
+        self._pending.append((self._count, image_bytes, label, path))
+        self._count += 1
+        try:
+            self._put(*self._pending[-1])
+        except lmdb.MapFullError:
+            self._grow()
+
+    def _put(self, index, image_bytes, label, path):
+        image_key, label_key, path_key = get_record_key(index)
+        if not self._txn.put(image_key.encode(), image_bytes):
+            print('write image data to lmdb failed')
+        lmdb_put_text(self._txn, label_key, label)
+        if path is not None:
+            self._txn.put(path_key.encode(), path)
+
+    def _grow(self):
+        # same as write_with_retry, grow the map and write the batch again in a new transaction
+        while True:
+            self._txn.abort()
+            grow_map(self._lmdb)
+            self._txn = self._lmdb.begin(write=True)
+            try:
+                for record in self._pending:
+                    self._put(*record)
+                return
+            except lmdb.MapFullError:
+                pass
+
+    def checkpoint(self, last_index, counters):
+        counters = ';'.join('{}={}'.format(name, count) for name, count in counters)
+        while True:
+            try:
+                lmdb_put_int(self._txn, 'num-samples', self._count)
+                lmdb_put_int(self._txn, 'checkpoint-last-index', last_index)
+                lmdb_put_text(self._txn, 'checkpoint-counters', counters)
+                self._txn.commit()
+                break
+            except lmdb.MapFullError:
+                self._grow()
+        self._pending = []
+        self._txn = self._lmdb.begin(write=True)
+
+    def close(self):
+        self._txn.abort()
+        self._lmdb.close()
+
+
+def load_checkpoint(writers):
+    # every writer commits the same checkpoint, but a crash can land between two commits,
+    # so resume from the oldest one and rewind the buckets that got further
+    checkpoints = [writer.read_checkpoint() for writer in writers]
+    if not checkpoints or any(checkpoint is None for checkpoint in checkpoints):
+        return None
+    last_index, counters = min(checkpoints, key=lambda checkpoint: checkpoint[0])
+    for writer in writers:
+        writer.rewind(counters.get(writer.name, 0))
+    return last_index
+
+
+def read_sample_count(source_path):
+    # (num-samples, index of the first record): records start at 0 or, like the labeler and import write them, at 1
+    source = open_environment(source_path, READER)
+    layout = detect_layout(source)
+    with source.begin(write=False) as txn:
+        n_samples = lmdb_get_int(txn, 'num-samples')
+        first_index = 0 if layout.get(txn, IMAGE, 0) is not None else 1
+    source.close()
+    return n_samples, first_index
+
+
+def run(source_path, output_path, workers=None, chunk_size=1000, commit_every=50000, first_index=None,
+        garbage=False, min_pixels_per_char=5, map_size=10995117000, report_interval=10.0, resize=True):
+    n_samples, detected_first_index = read_sample_count(source_path)
+    if n_samples is None:
+        print('can not find num-samples in {}'.format(source_path))
+        return None
+    if first_index is None:
+        first_index = detected_first_index
+
+    writers = [BucketWriter(bucket_name(resize), os.path.join(output_path, bucket_name(resize)), map_size)
+               for resize in resize_array]
+    garbage_writer = None
+    if garbage:
+        garbage_writer = BucketWriter('garbage', os.path.join(output_path, 'lmdb'), map_size)
+        writers.append(garbage_writer)
+    else:
+        min_pixels_per_char = 0
+
+    def counters():
+        return [(writer.name, writer.count) for writer in writers]
+
+    start_index = first_index
+    last_index = load_checkpoint(writers)
+    if last_index is not None:
+        start_index = last_index + 1
+        print('resume from source index {}'.format(start_index))
+
+    end = first_index + n_samples
+    tasks = [(start, min(start + chunk_size, end)) for start in range(start_index, end, chunk_size)]
+    workers = workers or os.cpu_count()
+    progress = ProgressReport(max(end - start_index, 0), interval=report_interval)
+    uncommitted = 0
+
+    # results are consumed in submission order so every bucket is written in source order
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(source_path, min_pixels_per_char, resize)) as pool:
+        # opened after the pool forked, lmdb environments must not be shared with child processes
+        source = open_environment(source_path, READER)
+        source_layout = detect_layout(source)
+        source_txn = source.begin(write=False, buffers=True)
+        for (start, stop), records in ordered_imap(pool, bucket_range, tasks, workers * 2):
+            # records of a chunk are in index order, so their unchanged images and paths come from one scan
+            source_records = scan_records(source_txn, source_layout, [record[0] for record in records], labels=False)
+            for (index, slot, image_bytes, label), (_, source_image, _, path) in zip(records, source_records):
+                if image_bytes is None:
+                    image_bytes = source_image
+                writer = garbage_writer if slot == GARBAGE_SLOT else writers[slot]
+                writer.put(image_bytes, label, path)
+            last_index = stop - 1
+            uncommitted += stop - start
+            if uncommitted >= commit_every:
+                for writer in writers:
+                    writer.checkpoint(last_index, counters())
+                uncommitted = 0
+            progress.update(stop - start, counters())
+
+        source_txn.abort()
+        source.close()
+
+    for writer in writers:
+        if last_index is not None:
+            writer.checkpoint(last_index, counters())
+        writer.close()
+
+    progress.finish(counters())
+    return counters()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='split a text patch lmdb into aspect ratio buckets, '
+                                                 'an interrupted or outdated output is continued from its checkpoint')
+    parser.add_argument('source', help='source lmdb folder')
+    parser.add_argument('output', help='folder for the bucket lmdb folders')
+    parser.add_argument('--workers', type=int, default=None, help='decode processes (default: cpu count)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='records per worker task')
+    parser.add_argument('--commit-every', type=int, default=50000,
+                        help='source records per write transaction and checkpoint')
+    parser.add_argument('--first-index', type=int, default=None,
+                        help='index of the first source record (default: 0 if the source has a record 0, else 1)')
+    parser.add_argument('--garbage', action='store_true',
+                        help='move patches with too few pixels per character to output/lmdb')
+    parser.add_argument('--min-pixels-per-char', type=float, default=5)
+    parser.add_argument('--map-size', type=int, default=10995117000)
+    parser.add_argument('--no-resize', dest='resize', action='store_false',
+                        help='only bucket by aspect ratio and copy the encoded images unchanged')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress reports')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run(args.source, args.output, args.workers, args.chunk_size, args.commit_every, args.first_index,
+        args.garbage, args.min_pixels_per_char, args.map_size, args.report_interval, args.resize)
+
+
+if __name__ == "__main__":
+    main()
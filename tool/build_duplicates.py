@@ -0,0 +1,74 @@
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DuplicateIndex import DuplicateIndex, duplicates_path, hash_image_bytes
+from LabelDataModel import TextRecognitionImagePatchDataset
+from LmdbConfig import READER
+from tool.ordered_pool import ordered_imap
+from tool.progress import ProgressReport
+
+_dataset = None
+
+
+def _init_worker(source_path):
+    global _dataset
+    _dataset = TextRecognitionImagePatchDataset(source_path, prefetch_depth=0, profile=READER)
+
+
+def hash_range(index_range):
+    start, end = index_range
+    indices = []
+    hashes = []
+    for index, image_bytes, _, _ in _dataset.iter_raw_records(start, end):
+        value = hash_image_bytes(image_bytes)
+        if value is not None:
+            indices.append(index)
+            hashes.append(value)
+    return np.array(indices, dtype=np.int64), np.array(hashes, dtype=np.uint64)
+
+
+def run(lmdb_path, workers=None, chunk_size=2000, max_distance=3, report_interval=10.0):
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=0, profile=READER)
+    n_samples = dataset.patch_count
+    dataset.close()
+
+    duplicates = DuplicateIndex.create(duplicates_path(lmdb_path), n_samples + 1)
+    workers = workers or os.cpu_count()
+    tasks = ((start, min(start + chunk_size, n_samples + 1)) for start in range(0, n_samples + 1, chunk_size))
+    progress = ProgressReport(n_samples + 1, interval=report_interval)
+    hashed = 0
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(lmdb_path,)) as pool:
+        for (start, end), (indices, hashes) in ordered_imap(pool, hash_range, tasks, workers * 2):
+            for index, value in zip(indices, hashes):
+                duplicates.set_hash(index, value)
+            hashed += len(indices)
+            progress.update(end - start, [('hashed', hashed)])
+
+    clusters = duplicates.build_clusters(max_distance)
+    duplicates.flush()
+    sizes = duplicates.cluster_sizes()
+    progress.finish([('hashed', hashed), ('clusters', clusters),
+                     ('in clusters of 2+', int(sizes[sizes > 1].sum()))])
+    return duplicates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='hash every image of a lmdb and group near duplicates, '
+                                                 'the labeler can then show and label one patch per group')
+    parser.add_argument('lmdb', help='lmdb folder')
+    parser.add_argument('--workers', type=int, default=None, help='hashing processes (default: cpu count)')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='records per worker task')
+    parser.add_argument('--max-distance', type=int, default=3,
+                        help='images whose 64 bit hashes differ in at most this many bits are duplicates')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress reports')
+    args = parser.parse_args(argv)
+    run(args.lmdb, args.workers, args.chunk_size, args.max_distance, args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import TextRecognitionImagePatchDataset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build the width/height/label metadata index next to a lmdb')
+    parser.add_argument('lmdb', help='lmdb folder')
+    parser.add_argument('--min-pixels-per-char', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    dataset = TextRecognitionImagePatchDataset(args.lmdb, prefetch_depth=0)
+    metadata = dataset.build_metadata_index()
+    if metadata is None:
+        return
+    print('indexed {} records in {:.1f}s'.format(dataset.patch_count, time.time() - t0))
+    print('valid {} suspicious {}'.format(int(np.count_nonzero(metadata.valid_mask())),
+                                          int(np.count_nonzero(metadata.suspicious_mask(args.min_pixels_per_char)))))
+    dataset.close()
+
+
+if __name__ == "__main__":
+    main()
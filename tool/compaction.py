@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import lmdb_get_int, lmdb_put_int, TO_BE_DELETED_LABEL, DELETED_LABEL
+from LmdbConfig import READER, BULK_WRITER, open_environment, map_size_for
+from RecordLayout import IMAGE, LABEL, PATH, detect_layout, create_layout
+from RecordScan import scan_records
+from tool.progress import ProgressReport
+
+REMOVED = -1
+
+
+def is_tombstone(label):
+    return label is None or label in (TO_BE_DELETED_LABEL.encode(), DELETED_LABEL.encode())
+
+
+def compact(source_path, output_path, commit_every=50000, map_size=None, report_interval=10.0):
+    source = open_environment(source_path, READER, sequential=True)
+    if map_size is None:
+        map_size = map_size_for(source_path)
+    output = open_environment(output_path, BULK_WRITER, map_size=map_size, create=True)
+    layout = detect_layout(source)
+
+    with source.begin(write=False) as source_txn:
+        n_samples = lmdb_get_int(source_txn, 'num-samples')
+        first_index = 0 if layout.get(source_txn, IMAGE, 0) is not None else 1
+    if n_samples is None:
+        print('can not find num-samples in {}'.format(source_path))
+        return None
+
+    with source.begin(write=False, buffers=True) as source_txn:
+        # old index -> new index, REMOVED for dropped records. kept on disk so memory does not grow with the dataset
+        index_map = np.lib.format.open_memmap(os.path.join(output_path, 'index_map.npy'), mode='w+',
+                                              dtype=np.int64, shape=(first_index + n_samples,))
+        index_map[:] = REMOVED
+        progress = ProgressReport(n_samples, interval=report_interval)
+        new_index = first_index
+        uncommitted = 0
+        output_txn = output.begin(write=True)
+        # the compacted lmdb keeps the record layout of the source
+        output_layout = create_layout(output, output_txn, layout.version)
+        for index, image, label, path in scan_records(source_txn, layout, range(first_index, first_index + n_samples)):
+            if image is None or is_tombstone(None if label is None else bytes(label)):
+                progress.update(1)
+                continue
+
+            output_layout.put(output_txn, IMAGE, new_index, image)
+            output_layout.put(output_txn, LABEL, new_index, label)
+            if path is not None:
+                output_layout.put(output_txn, PATH, new_index, path)
+            index_map[index] = new_index
+            new_index += 1
+
+            uncommitted += 1
+            if uncommitted >= commit_every:
+                lmdb_put_int(output_txn, 'num-samples', new_index - first_index)
+                output_txn.commit()
+                output_txn = output.begin(write=True)
+                uncommitted = 0
+            progress.update(1)
+
+        lmdb_put_int(output_txn, 'num-samples', new_index - first_index)
+        output_txn.commit()
+
+    index_map.flush()
+    output.close()
+    source.close()
+    kept = new_index - first_index
+    progress.finish([('kept', kept), ('removed', n_samples - kept)])
+    return kept
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='copy a lmdb without deleted records and renumber the rest, '
+                                                 'output/index_map.npy maps old indexes to new ones (-1: removed)')
+    parser.add_argument('source', help='source lmdb folder')
+    parser.add_argument('output', help='compacted lmdb folder')
+    parser.add_argument('--commit-every', type=int, default=50000, help='records per write transaction')
+    parser.add_argument('--map-size', type=int, default=None, help='default: size of the source data.mdb plus growth')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress reports')
+    args = parser.parse_args(argv)
+    compact(args.source, args.output, args.commit_every, args.map_size, args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
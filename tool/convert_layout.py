@@ -0,0 +1,91 @@
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DuplicateIndex import duplicates_path
+from EditLog import edit_log_path
+from LeaseTable import LEASE_DB
+from LmdbConfig import READER, BULK_WRITER, open_environment, map_size_for
+from MetadataIndex import metadata_path
+from RecordLayout import FIELDS, LAYOUT_KEY, LAYOUTS, PackedLayout, PrefixedLayout, detect_layout, create_layout
+from RecordScan import iter_field
+from tool.progress import ProgressReport
+
+
+def is_record_key(key):
+    # keys of either layout that belong to the records, everything else in the main database is copied as it is
+    key = bytes(key)
+    return (key == LAYOUT_KEY or key.startswith(LEASE_DB) or key in PackedLayout.DB_NAMES.values()
+            or any(key.startswith(prefix) for prefix in PrefixedLayout.PREFIXES.values()))
+
+
+def copy_sidecars(source_path, output_path):
+    # the indexes next to the lmdb are by record index and stay valid, the label index is rebuilt on open anyway
+    for path_of in (metadata_path, duplicates_path):
+        source, output = path_of(source_path), path_of(output_path)
+        if os.path.isdir(source):
+            shutil.copytree(source, output, dirs_exist_ok=True)
+    if os.path.exists(edit_log_path(source_path)):
+        shutil.copy2(edit_log_path(source_path), edit_log_path(output_path))
+
+
+def convert(source_path, output_path, version, commit_every=50000, map_size=None, report_interval=10.0):
+    source = open_environment(source_path, READER, sequential=True)
+    layout = detect_layout(source)
+    if layout.version == version:
+        print('{} already has record layout version {}'.format(source_path, version))
+        source.close()
+        return None
+    if map_size is None:
+        map_size = map_size_for(source_path)
+    output = open_environment(output_path, BULK_WRITER, map_size=map_size, create=True)
+
+    with source.begin(write=False, buffers=True) as source_txn:
+        n_entries = source.stat()['entries'] if layout.version == PrefixedLayout.version else sum(
+            source_txn.stat(layout.db(field))['entries'] for field in FIELDS)
+        progress = ProgressReport(n_entries, unit='values', interval=report_interval)
+        output_txn = output.begin(write=True)
+        output_layout = create_layout(output, output_txn, version)
+        for key, value in source_txn.cursor():
+            if not is_record_key(key):
+                output_txn.put(bytes(key), value)
+
+        # one field after the other, each is a single ordered walk over the source and appends to the output
+        uncommitted = 0
+        for field in FIELDS:
+            for index, value in iter_field(source_txn, layout, field):
+                output_layout.put(output_txn, field, index, value)
+                uncommitted += 1
+                if uncommitted >= commit_every:
+                    output_txn.commit()
+                    output_txn = output.begin(write=True)
+                    progress.update(uncommitted)
+                    uncommitted = 0
+        output_txn.commit()
+        progress.update(uncommitted)
+
+    output.close()
+    source.close()
+    copy_sidecars(source_path, output_path)
+    progress.finish()
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='copy a lmdb into another record layout, version 2 keeps images, '
+                                                 'labels and paths in separate sub-databases')
+    parser.add_argument('source', help='source lmdb folder')
+    parser.add_argument('output', help='converted lmdb folder')
+    parser.add_argument('--layout', type=int, choices=sorted(LAYOUTS), default=PackedLayout.version,
+                        help='record layout version of the output')
+    parser.add_argument('--commit-every', type=int, default=50000, help='values per write transaction')
+    parser.add_argument('--map-size', type=int, default=None, help='default: size of the source data.mdb plus growth')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress reports')
+    args = parser.parse_args(argv)
+    convert(args.source, args.output, args.layout, args.commit_every, args.map_size, args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import TextRecognitionImagePatchDataset, get_image_size, label_flags
+from LmdbConfig import READER
+from tool.bucketing import bucket_name, resize_array, select_slot
+from tool.progress import ProgressReport
+
+TAR = 'tar'
+BLOB = 'blob'
+
+# one row per record of a shard: source index, image offset, image size, label offset, label size
+INDEX_COLUMNS = 5
+
+
+def image_extension(image_bytes):
+    return 'png' if bytes(image_bytes[:4]) == b'\x89PNG' else 'jpg'
+
+
+class ShardWriter:
+    def __init__(self, directory, prefix, shard_format=TAR, max_bytes=256 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._prefix = prefix
+        self._format = shard_format
+        self._max_bytes = max_bytes
+        self._sequence = 0
+        self._file = None
+        self._tar = None
+        self._path = None
+        self._rows = []
+        self._shards = []
+
+    @property
+    def shards(self):
+        return self._shards
+
+    def write(self, index, image_bytes, label):
+        label_bytes = label.encode('utf-8')
+        if self._file is not None and self._rows and self._size() + len(image_bytes) + len(label_bytes) > self._max_bytes:
+            self._close_shard()
+        if self._file is None:
+            self._open_shard()
+
+        key = '%09d' % index
+        if self._format == TAR:
+            image_offset = self._add_member('{}.{}'.format(key, image_extension(image_bytes)), image_bytes)
+            label_offset = self._add_member(key + '.txt', label_bytes)
+        else:
+            image_offset = self._file.tell()
+            self._file.write(image_bytes)
+            label_offset = self._file.tell()
+            self._file.write(label_bytes)
+        self._rows.append((index, image_offset, len(image_bytes), label_offset, len(label_bytes)))
+
+    def close(self):
+        if self._file is not None:
+            self._close_shard()
+        return self._shards
+
+    def _size(self):
+        return self._tar.offset if self._tar is not None else self._file.tell()
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        # the tar offset now points behind the data padded to 512 byte blocks
+        return self._tar.offset - (len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+
+    def _open_shard(self):
+        extension = 'tar' if self._format == TAR else 'bin'
+        self._path = os.path.join(self._directory, '{}-{:05d}.{}'.format(self._prefix, self._sequence, extension))
+        self._file = open(self._path, 'wb')
+        if self._format == TAR:
+            self._tar = tarfile.open(fileobj=self._file, mode='w', format=tarfile.USTAR_FORMAT)
+        self._sequence += 1
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        size = self._file.tell()
+        self._file.close()
+        np.save(self._path + '.idx.npy', np.array(self._rows, dtype=np.int64).reshape(-1, INDEX_COLUMNS))
+        self._shards.append({'path': self._path, 'count': len(self._rows), 'bytes': size})
+        self._file = None
+        self._rows = []
+
+
+# random access to a shard through its offset index, works for tar and blob shards
+class ShardReader:
+    def __init__(self, shard_path):
+        self._index = np.load(shard_path + '.idx.npy')
+        self._file = open(shard_path, 'rb')
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, item):
+        index, image_offset, image_size, label_offset, label_size = self._index[item].tolist()
+        self._file.seek(image_offset)
+        image_bytes = self._file.read(image_size)
+        self._file.seek(label_offset)
+        label = self._file.read(label_size).decode('utf-8')
+        return index, image_bytes, label
+
+    def close(self):
+        self._file.close()
+
+
+def export_range(task):
+    worker_id, start, end, source_path, output_path, shard_format, max_bytes, bucket, resize = task
+    dataset = TextRecognitionImagePatchDataset(source_path, prefetch_depth=0, profile=READER)
+    writers = {}
+    exported = 0
+    for index, image_bytes, label, _ in dataset.iter_raw_records(start, end):
+        if label_flags(label) != 0:
+            continue
+        slot = None
+        if bucket:
+            size = get_image_size(image_bytes)
+            image = None
+            if size is None:
+                image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                size = image.shape[1], image.shape[0]
+            slot = select_slot(size[0], size[1], label)
+            if resize and size != resize_array[slot]:
+                if image is None:
+                    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+                image = cv2.resize(image, resize_array[slot], interpolation=cv2.INTER_CUBIC)
+                image_bytes = cv2.imencode('.jpg', image)[1].tobytes()
+
+        if slot not in writers:
+            directory = output_path if slot is None else os.path.join(output_path, bucket_name(resize_array[slot]))
+            writers[slot] = ShardWriter(directory, 'shard-{:04d}'.format(worker_id), shard_format, max_bytes)
+        writers[slot].write(index, image_bytes, label)
+        exported += 1
+    dataset.close()
+
+    shards = []
+    for slot, writer in writers.items():
+        for shard in writer.close():
+            shard['bucket'] = None if slot is None else bucket_name(resize_array[slot])
+            shards.append(shard)
+    return end - start, exported, shards
+
+
+def export(source_path, output_path, shard_format=TAR, max_bytes=256 * 1024 * 1024, workers=None,
+           bucket=False, resize=False, tasks_per_worker=4):
+    dataset = TextRecognitionImagePatchDataset(source_path, prefetch_depth=0, profile=READER)
+    n_samples = dataset.patch_count
+    dataset.close()
+
+    # index 0 is included so both 0 and 1 based lmdbs are covered, missing records are skipped
+    workers = workers or os.cpu_count()
+    task_count = workers * tasks_per_worker
+    bounds = np.linspace(0, n_samples + 1, task_count + 1).astype(np.int64)
+    tasks = [(worker_id, int(bounds[worker_id]), int(bounds[worker_id + 1]), source_path, output_path,
+              shard_format, max_bytes, bucket, resize)
+             for worker_id in range(task_count) if bounds[worker_id] < bounds[worker_id + 1]]
+
+    os.makedirs(output_path, exist_ok=True)
+    progress = ProgressReport(n_samples + 1)
+    shards = []
+    exported = 0
+    with multiprocessing.Pool(workers) as pool:
+        for scanned, count, task_shards in pool.imap(export_range, tasks):
+            shards.extend(task_shards)
+            exported += count
+            progress.update(scanned, [('exported', exported)])
+
+    shards.sort(key=lambda shard: shard['path'])
+    for shard in shards:
+        shard['path'] = os.path.relpath(shard['path'], output_path)
+    manifest = {'source': os.path.abspath(source_path), 'format': shard_format, 'count': exported,
+                'index_columns': ['index', 'image_offset', 'image_size', 'label_offset', 'label_size'],
+                'shards': shards}
+    with open(os.path.join(output_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    progress.finish([('exported', exported), ('shards', len(shards))])
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='export the labeled lmdb to size bounded shards with a manifest')
+    parser.add_argument('source', help='lmdb folder')
+    parser.add_argument('output', help='folder for shards and manifest.json')
+    parser.add_argument('--format', choices=[TAR, BLOB], default=TAR,
+                        help='tar: webdataset style members, blob: images and labels back to back')
+    parser.add_argument('--shard-size', type=int, default=256, help='maximum shard size in MB')
+    parser.add_argument('--workers', type=int, default=None, help='writer processes (default: cpu count)')
+    parser.add_argument('--bucket', action='store_true', help='separate shards per aspect ratio bucket')
+    parser.add_argument('--resize', action='store_true', help='resize bucketed images to their bucket size')
+    args = parser.parse_args(argv)
+    export(args.source, args.output, args.format, args.shard_size * 1024 * 1024, args.workers, args.bucket,
+           args.resize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import get_image_size, lmdb_get_int, lmdb_put_int
+from LmdbConfig import BULK_WRITER, GB, open_environment
+from RecordLayout import IMAGE, LABEL, PATH, LAYOUTS, detect_layout, create_layout
+from tool.ordered_pool import ordered_imap
+from tool.progress import ProgressReport
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+_verify = False
+
+
+def list_directory(root):
+    # the label of an image is read from a .txt file of the same name, or taken from the file name
+    items = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                items.append((os.path.join(dirpath, name), None))
+    return items
+
+
+def list_label_file(label_path, delimiter, skip_header=False):
+    base = os.path.dirname(os.path.abspath(label_path))
+    items = []
+    with open(label_path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+        if skip_header:
+            next(reader, None)
+        for row in reader:
+            if len(row) < 2:
+                continue
+            path = row[0] if os.path.isabs(row[0]) else os.path.join(base, row[0])
+            items.append((path, delimiter.join(row[1:])))
+    return items
+
+
+def read_label(path, label):
+    if label is not None:
+        return label
+    text_path = os.path.splitext(path)[0] + '.txt'
+    if os.path.exists(text_path):
+        with open(text_path, encoding='utf-8') as f:
+            return f.read().strip()
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_image(path):
+    # JPEG and PNG files are stored as they are, anything else is converted to JPEG
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = get_image_size(data)
+    if size is not None and size[0] > 0 and size[1] > 0 and not _verify:
+        return data
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    if size is not None:
+        return data
+    is_success, buffer = cv2.imencode('.jpg', image)
+    if not is_success:
+        return None
+    return buffer.tobytes()
+
+
+def _init_worker(verify):
+    global _verify
+    _verify = verify
+
+
+def load_items(task):
+    _, _, items = task
+    records = []
+    for path, label in items:
+        try:
+            image_bytes = read_image(path)
+            label = read_label(path, label)
+        except (OSError, UnicodeDecodeError) as e:
+            print('can not read {}: {}'.format(path, e))
+            image_bytes = None
+        if image_bytes is None or not label:
+            records.append(None)
+            continue
+        records.append((image_bytes, label, path))
+    return records
+
+
+def estimate_map_size(items):
+    total = 0
+    for path, _ in items:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    # keys, labels and b-tree pages, plus room for converted images
+    return int(total * 1.5) + len(items) * 256 + GB
+
+
+def run(items, output_path, workers=None, chunk_size=500, commit_every=50000, first_index=1, verify=False,
+        map_size=None, report_interval=10.0, layout_version=1):
+    if map_size is None:
+        map_size = estimate_map_size(items)
+    output = open_environment(output_path, BULK_WRITER, map_size=map_size, create=True)
+
+    # a previous run stored how many input items it consumed, continue behind them
+    with output.begin(write=False) as txn:
+        n_samples = lmdb_get_int(txn, 'num-samples') or 0
+        next_item = lmdb_get_int(txn, 'import-next-item') or 0
+    if next_item > 0:
+        print('resume from input item {} with {} samples'.format(next_item, n_samples))
+
+    tasks = ((start, min(start + chunk_size, len(items)), items[start:start + chunk_size])
+             for start in range(next_item, len(items), chunk_size))
+    workers = workers or os.cpu_count()
+    progress = ProgressReport(len(items) - next_item, unit='images', interval=report_interval)
+    skipped = 0
+    uncommitted = 0
+    # a continued import keeps the layout the lmdb was started with. it is read before the write transaction
+    # begins, the bulk writer environment has no lock to let a second transaction open the sub-databases
+    layout = detect_layout(output) if next_item > 0 else None
+    txn = output.begin(write=True)
+    if layout is None:
+        layout = create_layout(output, txn, layout_version)
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(verify,)) as pool:
+        for (start, stop, _), records in ordered_imap(pool, load_items, tasks, workers * 2):
+            for record in records:
+                if record is None:
+                    skipped += 1
+                    continue
+                image_bytes, label, path = record
+                index = first_index + n_samples
+                layout.put(txn, IMAGE, index, image_bytes)
+                layout.put(txn, LABEL, index, label.encode())
+                layout.put(txn, PATH, index, path.encode())
+                n_samples += 1
+            uncommitted += stop - start
+            if uncommitted >= commit_every or stop == len(items):
+                lmdb_put_int(txn, 'num-samples', n_samples)
+                lmdb_put_int(txn, 'import-next-item', stop)
+                txn.commit()
+                txn = output.begin(write=True)
+                uncommitted = 0
+            progress.update(stop - start, [('imported', n_samples), ('skipped', skipped)])
+
+    txn.abort()
+    output.close()
+    progress.finish([('imported', n_samples), ('skipped', skipped)])
+    return n_samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build a labeler lmdb from an image folder or a list of '
+                                                 '(path, label) rows, an interrupted import is continued')
+    parser.add_argument('source', help='image folder, or a .tsv/.csv/.txt file of path and label')
+    parser.add_argument('output', help='lmdb folder to create')
+    parser.add_argument('--delimiter', default=None, help='column delimiter of the label file (default: by extension)')
+    parser.add_argument('--skip-header', action='store_true', help='the label file starts with a header row')
+    parser.add_argument('--workers', type=int, default=None, help='reader processes (default: cpu count)')
+    parser.add_argument('--chunk-size', type=int, default=500, help='images per worker task')
+    parser.add_argument('--commit-every', type=int, default=50000, help='images per write transaction')
+    parser.add_argument('--first-index', type=int, default=1, help='index of the first record')
+    parser.add_argument('--verify', action='store_true', help='fully decode JPEG/PNG files to reject broken ones')
+    parser.add_argument('--map-size', type=int, default=None, help='default: estimated from the image file sizes')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress reports')
+    parser.add_argument('--layout', type=int, choices=sorted(LAYOUTS), default=1,
+                        help='record layout of a new lmdb, 2 keeps labels and paths apart from the images')
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        items = list_directory(args.source)
+    else:
+        delimiter = args.delimiter
+        if delimiter is None:
+            delimiter = ',' if args.source.lower().endswith('.csv') else '\t'
+        items = list_label_file(args.source, delimiter, args.skip_header)
+    print('{} input images'.format(len(items)))
+    run(items, args.output, args.workers, args.chunk_size, args.commit_every, args.first_index, args.verify,
+        args.map_size, args.report_interval, args.layout)
+
+
+if __name__ == "__main__":
+    main()
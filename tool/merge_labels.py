@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import TextRecognitionImagePatchDataset, KEEP_MINE, TAKE_THEIRS, CONFLICT
+from LmdbConfig import VIEWER
+
+
+def write_conflicts(path, conflicts):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('index\tmine\ttheirs\tbase\n')
+        for index, mine, theirs, base in conflicts:
+            f.write('{}\t{}\t{}\t{}\n'.format(index, mine, theirs, base))
+
+
+def diff(mine_path, theirs_path, base_path=None):
+    # counts per resolution and the conflicts, nothing is written
+    dataset = TextRecognitionImagePatchDataset(mine_path, prefetch_depth=0, profile=VIEWER)
+    records = dataset.diff_labels(theirs_path, base_path)
+    counts = {KEEP_MINE: 0, TAKE_THEIRS: 0, CONFLICT: 0}
+    conflicts = []
+    for index, mine, theirs, base, resolution in records or []:
+        counts[resolution] += 1
+        if resolution == CONFLICT:
+            conflicts.append((index, mine, theirs, base))
+    dataset.close()
+    return counts, conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='merge the labels of another copy of a lmdb into this one: labels '
+                                                 'only the other copy changed are taken, labels changed on both '
+                                                 'sides are conflicts')
+    parser.add_argument('mine', help='lmdb folder the labels are merged into')
+    parser.add_argument('theirs', help='lmdb folder the labels are taken from')
+    parser.add_argument('--base', help='copy of the lmdb taken when the two split (default: use their edit logs)')
+    parser.add_argument('--prefer', choices=[KEEP_MINE, TAKE_THEIRS], default=KEEP_MINE,
+                        help='label a conflicting record gets')
+    parser.add_argument('--batch-size', type=int, default=100000, help='records per write transaction')
+    parser.add_argument('--conflicts', help='write the conflicts to this tab separated file')
+    parser.add_argument('--dry-run', action='store_true', help='only count the differences')
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    if args.dry_run:
+        counts, conflicts = diff(args.mine, args.theirs, args.base)
+        print('{} differ: {} changed only in mine, {} only in theirs, {} conflicts in {:.1f}s'.format(
+            sum(counts.values()), counts[KEEP_MINE], counts[TAKE_THEIRS], counts[CONFLICT], time.time() - t0))
+    else:
+        dataset = TextRecognitionImagePatchDataset(args.mine, prefetch_depth=0)
+        result = dataset.merge_labels(args.theirs, args.base, args.prefer, args.batch_size)
+        dataset.close()
+        if result is None:
+            return
+        merged, conflicts = result
+        print('merged {} labels, {} conflicts in {:.1f}s'.format(merged, len(conflicts), time.time() - t0))
+    if args.conflicts is not None:
+        write_conflicts(args.conflicts, conflicts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+from collections import deque
+
+
+def ordered_imap(pool, func, tasks, window):
+    # like Pool.imap, but never more than window tasks are queued or waiting to be consumed
+    tasks = iter(tasks)
+    pending = deque()
+    for task in tasks:
+        pending.append((task, pool.apply_async(func, (task,))))
+        if len(pending) >= window:
+            break
+
+    while pending:
+        task, result = pending.popleft()
+        value = result.get()
+        next_task = next(tasks, None)
+        if next_task is not None:
+            pending.append((next_task, pool.apply_async(func, (next_task,))))
+        yield task, value
@@ -0,0 +1,40 @@
+import time
+
+
+class ProgressReport:
+    def __init__(self, total, unit='records', interval=10.0):
+        self._total = total
+        self._unit = unit
+        self._interval = interval
+        self._done = 0
+        self._t0 = time.time()
+        self._last_report = self._t0
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self._t0
+        if elapsed <= 0:
+            return 0.0
+        return self._done / elapsed
+
+    def update(self, count, counters=None):
+        self._done += count
+        now = time.time()
+        if now - self._last_report >= self._interval:
+            self._last_report = now
+            self.report(counters)
+
+    def report(self, counters=None):
+        print('----------------{0}/{1} {2} {3:.1f} {2}/s--------------'.format(self._done, self._total,
+                                                                            self._unit, self.rate))
+        if counters is not None:
+            for name, count in counters:
+                print('{0} {1} {2:0.1f}'.format(name, count, count / max(self._done, 1) * 100))
+
+    def finish(self, counters=None):
+        print('finished {0} {1} in {2:.1f}s'.format(self._done, self._unit, time.time() - self._t0))
+        self.report(counters)
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from EditLog import EditLog, REPLAY, edit_log_path, net_edits
+from LabelDataModel import TextRecognitionImagePatchDataset
+
+
+def select_entries(edit_log, sessions=None, since=0):
+    entry_ids = []
+    if sessions:
+        for session in sessions:
+            entry_ids.extend(edit_log.session_entries(session))
+    else:
+        entry_ids = [entry_id for session in edit_log.sessions() for entry_id in edit_log.session_entries(session)]
+    return sorted(entry_id for entry_id in entry_ids if entry_id > since)
+
+
+def replay(source_path, target_path, sessions=None, since=0, force=False, batch_size=100000):
+    # the net change of the selected entries is applied to the target in a few transactions. a record whose
+    # label in the target is not the one the edits started from was changed there too and is skipped,
+    # unless force is set
+    edit_log = EditLog(edit_log_path(source_path))
+    entry_ids = select_entries(edit_log, sessions, since)
+    edits = net_edits(edit_log.entries(entry_ids))
+    edit_log.close()
+
+    targets = [(index, None if force else old, new) for index, (old, new) in edits.items() if old != new]
+    dataset = TextRecognitionImagePatchDataset(target_path, prefetch_depth=0)
+    origin = '{}#{}'.format(os.path.abspath(source_path), max(entry_ids, default=0))
+    applied = dataset.apply_edits(targets, REPLAY, origin, batch_size)
+    dataset.close()
+    return len(entry_ids), len(targets), applied
+
+
+def revert(lmdb_path, session):
+    # the records the session changed get back the label they had before, records changed again since are kept
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=0)
+    reverted = dataset.revert_session(session)
+    dataset.close()
+    return reverted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='apply the label edits logged in one lmdb to another copy of it, '
+                                                 'or revert the edits of a session in the lmdb itself')
+    parser.add_argument('source', help='lmdb folder whose edits.log is replayed')
+    parser.add_argument('target', nargs='?', help='lmdb folder the edits are applied to')
+    parser.add_argument('--session', action='append', help='only edits of this session, can be repeated')
+    parser.add_argument('--since', type=int, default=0, help='only log entries with a larger id')
+    parser.add_argument('--force', action='store_true', help='also overwrite labels that were changed in the target')
+    parser.add_argument('--batch-size', type=int, default=100000, help='records per write transaction')
+    parser.add_argument('--list-sessions', action='store_true', help='print the sessions of the source log and exit')
+    parser.add_argument('--revert', metavar='SESSION', help='revert the edits this session made in the source')
+    args = parser.parse_args(argv)
+
+    if args.revert is not None:
+        t0 = time.time()
+        reverted = revert(args.source, args.revert)
+        if reverted is not None:
+            print('reverted {} records of session {} in {:.1f}s'.format(reverted, args.revert, time.time() - t0))
+        return
+
+    if args.list_sessions or args.target is None:
+        edit_log = EditLog(edit_log_path(args.source))
+        for session, count in edit_log.sessions().items():
+            print('{}\t{} entries'.format(session, count))
+        edit_log.close()
+        return
+
+    t0 = time.time()
+    entries, records, applied = replay(args.source, args.target, args.session, args.since, args.force,
+                                       args.batch_size)
+    print('replayed {} entries: {} records changed, {} applied, {} skipped in {:.1f}s'.format(
+        entries, records, applied, records - applied, time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
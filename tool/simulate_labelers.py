@@ -0,0 +1,111 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LabelDataModel import TextRecognitionImagePatchDataset
+from PatchFilter import PatchFilter
+
+SIMULATION_LEASE_DB = b'leases-simulation'
+
+
+def label_session(task):
+    # one labeler: leases a range, pages through it and writes labels back, until time is up or nothing is left
+    lmdb_path, owner, duration, lease_size, page_size, edits_per_page, think_time, ttl = task
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=1)
+    lease_table = dataset.lease_table(ttl, SIMULATION_LEASE_DB)
+    latencies = []
+    edits = 0
+    ranges = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        lease = lease_table.acquire(owner, lease_size)
+        if lease is None:
+            break
+        dataset.set_filter(PatchFilter.parse('range={}:{}'.format(lease.start, lease.stop)))
+        position = 0
+        while position < dataset.patch_count and time.time() < deadline:
+            t0 = time.perf_counter()
+            patches = dataset.get_patch_list(page_size, position)
+            latencies.append(time.perf_counter() - t0)
+            # labels are written back unchanged, the writes are real but the data stays as it is
+            for patch in patches[:edits_per_page]:
+                dataset.set_label(patch.index, patch.label)
+                edits += 1
+            if lease.expires - time.time() < ttl / 2:
+                lease = lease_table.renew(lease)
+                if lease is None:
+                    break
+            position += page_size
+            time.sleep(think_time)
+        if lease is None:
+            continue
+        done = position >= dataset.patch_count
+        lease_table.release(lease, done)
+        ranges += done
+    dataset.close()
+    return owner, np.array(latencies), edits, ranges
+
+
+def simulate(lmdb_path, sessions=4, duration=30.0, lease_size=1000, page_size=6, edits_per_page=6, think_time=0.0,
+             ttl=60.0):
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=0)
+    lease_table = dataset.lease_table(ttl, SIMULATION_LEASE_DB)
+    lease_table.clear()
+    dataset.close()
+
+    tasks = [(lmdb_path, 'simulated-{}'.format(number), duration, lease_size, page_size, edits_per_page, think_time,
+              ttl) for number in range(sessions)]
+    t0 = time.time()
+    with multiprocessing.Pool(sessions) as pool:
+        results = pool.map(label_session, tasks)
+    elapsed = time.time() - t0
+
+    dataset = TextRecognitionImagePatchDataset(lmdb_path, prefetch_depth=0)
+    lease_table = dataset.lease_table(ttl, SIMULATION_LEASE_DB)
+    leases = lease_table.leases()
+    lease_table.clear()
+    dataset.close()
+    return results, leases, elapsed
+
+
+def check_disjoint(leases):
+    # no two sessions may ever have been handed overlapping ranges
+    leases = sorted(leases, key=lambda lease: lease.start)
+    return all(previous.stop <= lease.start for previous, lease in zip(leases, leases[1:]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run several simulated labelers on one lmdb and report page '
+                                                 'latencies and label write throughput under contention')
+    parser.add_argument('lmdb', help='lmdb folder, labels are written back unchanged')
+    parser.add_argument('--sessions', type=int, default=4, help='labeler processes')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds every labeler works')
+    parser.add_argument('--lease-size', type=int, default=1000, help='records per leased range')
+    parser.add_argument('--page-size', type=int, default=6, help='patches per page')
+    parser.add_argument('--edits-per-page', type=int, default=6, help='labels written per page')
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds a labeler looks at a page')
+    parser.add_argument('--ttl', type=float, default=60.0, help='lease time to live in seconds')
+    args = parser.parse_args(argv)
+
+    results, leases, elapsed = simulate(args.lmdb, args.sessions, args.duration, args.lease_size, args.page_size,
+                                        args.edits_per_page, args.think_time, args.ttl)
+    total_edits = 0
+    for owner, latencies, edits, ranges in results:
+        total_edits += edits
+        if len(latencies) == 0:
+            print('{}: no pages'.format(owner))
+            continue
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print('{}: {} pages p50 {:.2f}ms p95 {:.2f}ms max {:.2f}ms, {} edits, {} ranges done'.format(
+            owner, len(latencies), p50, p95, latencies.max() * 1000, edits, ranges))
+    print('{} sessions: {} edits in {:.1f}s, {:.0f} edits/s, {} leases, ranges disjoint: {}'.format(
+        len(results), total_edits, elapsed, total_edits / elapsed, len(leases), check_disjoint(leases)))
+
+
+if __name__ == "__main__":
+    main()